@@ -2,17 +2,28 @@
 
 import argparse
 import ast
+import contextlib
+import csv
+import io
+import json
 import os
 import sys
+import tempfile
 import time
+import tokenize
+import tracemalloc
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from pathlib import PurePath
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
 
 sys.path.insert(0, os.getcwd())
 from pegen.build import build_parser
-from pegen.utils import generate_parser, print_memstats
+from pegen.memo_profile import MemoProfile
+from pegen.parser import Parser
+from pegen.tokenizer import Tokenizer
+from pegen.utils import generate_parser, import_file, print_memstats
 
 from scripts import show_parse
 
@@ -38,11 +49,49 @@ argparser.add_argument(
 argparser.add_argument(
     "--skip-actions",
     action="store_true",
-    help="Suppress code emission for rule actions",
+    help="Only check that the files parse, without running the actions of the rules",
 )
 argparser.add_argument(
     "-t", "--tree", action="count", help="Compare parse tree to official AST", default=0
 )
+argparser.add_argument(
+    "--memo-profile",
+    metavar="PROFILE",
+    help="Record the memoization cache hits and misses of every rule in a JSON file,"
+    " to be passed to pegen --memo-profile",
+)
+argparser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Parse the files in N worker processes (default: 1, in this process)",
+    metavar="N",
+)
+argparser.add_argument(
+    "--summary",
+    type=int,
+    metavar="N",
+    help="Only report parse failures, counts and the first N differences between trees",
+)
+argparser.add_argument(
+    "--report",
+    metavar="FILE",
+    help="Write the parse time, size, token count and memo entries of every file"
+    " to a JSON or CSV file (chosen by the extension of FILE)",
+)
+argparser.add_argument(
+    "--slowest",
+    type=int,
+    default=10,
+    metavar="N",
+    help="Number of slowest files listed with --report (default: 10)",
+)
+argparser.add_argument(
+    "--trace-memory",
+    action="store_true",
+    help="Record the peak memory used to parse every file, which makes parsing slower",
+)
 
 
 def report_status(
@@ -123,6 +172,236 @@ def compare_trees(
     return 1
 
 
+class FileResult(NamedTuple):
+    """Outcome of checking a file, sent back by the worker processes of --jobs."""
+
+    file: str
+    # None when neither pegen nor the ast module can parse the file.
+    succeeded: Optional[bool]
+    error: Optional[Exception]
+    seconds: float
+    # 1 if the tree differs from the one of the ast module.
+    tree_errors: int = 0
+    # What the tree comparison printed in the worker.
+    output: str = ""
+    profile: Optional[Dict[str, Dict[str, int]]] = None
+    lines: int = 0
+    bytes: int = 0
+    tokens: int = 0
+    memo_entries: int = 0
+    # Peak of the memory allocated while parsing, with --trace-memory.
+    peak_memory: Optional[int] = None
+
+
+def make_parse(
+    parser_class: Type[Parser], verbose: bool, profile: Optional[MemoProfile]
+) -> Callable[[str], Tuple[Any, int, int]]:
+    """Return a function parsing a file into its tree, token count and cache size."""
+
+    def parse(filepath: str) -> Tuple[Any, int, int]:
+        with open(filepath) as f:
+            tokengen = tokenize.generate_tokens(f.readline)
+            tokenizer = Tokenizer(tokengen, verbose=False)
+            parser = parser_class(tokenizer, verbose=verbose)
+            if profile is not None:
+                profile.instrument(parser)
+            tree = parser.start()
+            return tree, len(tokenizer._tokens), len(parser._cache)
+
+    return parse
+
+
+def check_file(
+    file: str, parse: Callable[[str], Tuple[Any, int, int]], verbose: bool, tree_arg: int
+) -> FileResult:
+    """Parse a file and, if tree_arg is set, compare its tree to the one of ast.
+
+    The tree is dropped once compared, and what the comparison prints is
+    returned in the output of the result.
+    """
+    with open(file, "rb") as f:
+        data = f.read()
+    sizes = {
+        "lines": data.count(b"\n") + (bool(data) and not data.endswith(b"\n")),
+        "bytes": len(data),
+    }
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            # Python < 3.9, this also forgets the blocks allocated so far.
+            tracemalloc.clear_traces()
+        baseline = tracemalloc.get_traced_memory()[0]
+    t0 = time.time()
+    try:
+        tree, tokens, memo_entries = parse(file)
+    except Exception as error:
+        seconds = time.time() - t0
+        try:
+            ast.parse(data)
+        except Exception:
+            return FileResult(file, None, error, seconds, **sizes)
+        return FileResult(file, False, error, seconds, **sizes)
+    seconds = time.time() - t0
+    result = FileResult(
+        file,
+        True,
+        None,
+        seconds,
+        tokens=tokens,
+        memo_entries=memo_entries,
+        peak_memory=tracemalloc.get_traced_memory()[1] - baseline if tracing else None,
+        **sizes,
+    )
+    if tree_arg:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tree_errors = compare_trees(tree, file, verbose, tree_arg >= 2)
+        result = result._replace(tree_errors=tree_errors, output=output.getvalue())
+    return result
+
+
+# Parse function of the worker processes of --jobs, set by init_worker().
+_worker: Dict[str, Any] = {}
+
+
+def init_worker(
+    parser_path: str,
+    parser_name: str,
+    verbose: bool,
+    tree_arg: int,
+    memo_profile: bool,
+    trace_memory: bool,
+) -> None:
+    parser_class = getattr(import_file("test_parse_directory_parser", parser_path), parser_name)
+    if trace_memory:
+        tracemalloc.start()
+    _worker.update(
+        parser_class=parser_class, verbose=verbose, tree_arg=tree_arg, memo_profile=memo_profile
+    )
+
+
+def check_file_in_worker(file: str) -> FileResult:
+    profile = MemoProfile() if _worker["memo_profile"] else None
+    parse = make_parse(_worker["parser_class"], _worker["verbose"], profile)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = check_file(file, parse, _worker["verbose"], _worker["tree_arg"])
+    return result._replace(
+        output=output.getvalue() + result.output,
+        profile=profile.rules if profile is not None else None,
+    )
+
+
+def check_files_in_workers(
+    files: List[str],
+    parser_path: str,
+    parser_name: str,
+    jobs: int,
+    verbose: bool,
+    tree_arg: int,
+    memo_profile: bool,
+    trace_memory: bool,
+) -> Iterator[FileResult]:
+    """Check files in a pool of processes, yielding the results in order."""
+    # Enough chunks per worker to balance the load, but not so many that the
+    # overhead of sending them dominates.
+    chunksize = max(1, min(64, len(files) // (jobs * 8)))
+    with ProcessPoolExecutor(
+        jobs,
+        initializer=init_worker,
+        initargs=(parser_path, parser_name, verbose, tree_arg, memo_profile, trace_memory),
+    ) as executor:
+        yield from executor.map(check_file_in_worker, files, chunksize=chunksize)
+
+
+REPORT_FIELDS = (
+    "file",
+    "status",
+    "seconds",
+    "lines",
+    "bytes",
+    "tokens",
+    "memo_entries",
+    "peak_memory",
+)
+
+
+def report_row(result: FileResult) -> Dict[str, Any]:
+    status = {True: "ok", False: "fail", None: "invalid"}[result.succeeded]
+    row = {field: getattr(result, field, None) for field in REPORT_FIELDS}
+    row["status"] = status
+    return row
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Nearest-rank percentiles of a non-empty list of values."""
+    values = sorted(values)
+    summary = {
+        f"p{p}": values[max(0, -(-len(values) * p // 100) - 1)] for p in (50, 90, 95, 99)
+    }
+    summary["max"] = values[-1]
+    return summary
+
+
+def summarize(rows: List[FileResult], slowest: int) -> Dict[str, Any]:
+    parsed = [row for row in rows if row.succeeded]
+    seconds = sum(row.seconds for row in rows)
+    summary: Dict[str, Any] = {
+        "files": len(rows),
+        "parsed": len(parsed),
+        "seconds": seconds,
+        "lines": sum(row.lines for row in rows),
+        "bytes": sum(row.bytes for row in rows),
+        "tokens": sum(row.tokens for row in parsed),
+    }
+    if seconds:
+        summary["lines_per_second"] = summary["lines"] / seconds
+        summary["tokens_per_second"] = summary["tokens"] / seconds
+    if parsed:
+        summary["percentiles"] = {
+            "seconds": percentiles([row.seconds for row in parsed]),
+            "tokens": percentiles([row.tokens for row in parsed]),
+            "memo_entries": percentiles([row.memo_entries for row in parsed]),
+        }
+        memory = [row.peak_memory for row in parsed if row.peak_memory is not None]
+        if memory:
+            summary["percentiles"]["peak_memory"] = percentiles(memory)
+    summary["slowest"] = [
+        report_row(row) for row in sorted(rows, key=lambda row: -row.seconds)[:slowest]
+    ]
+    return summary
+
+
+def write_report(path: str, rows: List[FileResult], slowest: int) -> None:
+    """Write the results of every file to a JSON or CSV file and print a summary."""
+    summary = summarize(rows, slowest)
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(report_row(row) for row in rows)
+    else:
+        with open(path, "w") as f:
+            json.dump(
+                {"summary": summary, "files": [report_row(row) for row in rows]}, f, indent=2
+            )
+            f.write("\n")
+
+    if "percentiles" in summary:
+        print("Parse time percentiles:")
+        for name, value in summary["percentiles"]["seconds"].items():
+            print(f"  {name:>4}: {value:10.3f} sec")
+    if summary["slowest"]:
+        print(f"Slowest {len(summary['slowest'])} files:")
+        for row in summary["slowest"]:
+            print(
+                f"  {row['seconds']:8.3f} sec {row['lines']:8,} lines"
+                f" {row['tokens']:9,} tokens  {row['file']}"
+            )
+
+
 def parse_directory(
     directory: str,
     grammar_file: str,
@@ -132,109 +411,175 @@ def parse_directory(
     tree_arg: int,
     short: bool,
     parser: Any,
+    memo_profile: Optional[str] = None,
+    jobs: int = 1,
+    summary: Optional[int] = None,
+    report: Optional[str] = None,
+    slowest: int = 10,
+    trace_memory: bool = False,
 ) -> int:
     if not directory:
         print("You must specify a directory of files to test.", file=sys.stderr)
         return 1
 
-    if grammar_file:
-        if not os.path.exists(grammar_file):
-            print(f"The specified grammar file, {grammar_file}, does not exist.", file=sys.stderr)
-            return 1
+    with tempfile.TemporaryDirectory() as parser_dir:
+        # With --jobs the workers import the parser from a file.
+        parser_path = os.path.join(parser_dir, "parser.py") if jobs > 1 else None
+        if parser:
+            GeneratedParser = parser
+        elif grammar_file:
+            if not os.path.exists(grammar_file):
+                print(
+                    f"The specified grammar file, {grammar_file}, does not exist.",
+                    file=sys.stderr,
+                )
+                return 1
 
-        try:
-            if not parser:
+            try:
                 grammar = build_parser(grammar_file)[0]
-                GeneratedParser = generate_parser(grammar)  # TODO: skip_actions
-        except Exception as err:
-            print(
-                f"{FAIL}The following error occurred when generating the parser."
-                f" Please check your grammar file.\n{ENDC}",
-                file=sys.stderr,
-            )
-            traceback.print_exception(err.__class__, err, None)
-
-            return 1
-
-    else:
-        print("A grammar file was not provided - attempting to use existing file...\n")
-        try:
-            sys.path.insert(0, sys.path.insert(0, os.path.join(os.getcwd(), "data")))
-            from python_parser import GeneratedParser
-        except:
-            print(
-                "An existing parser was not found. Please run `make` or specify a grammar file with the `-g` flag.",
-                file=sys.stderr,
-            )
-            return 1
-
-    try:
-        import tokenize
+                GeneratedParser = generate_parser(
+                    grammar,
+                    parser_path,
+                    grammar.metas.get("class", "GeneratedParser"),
+                    skip_actions=skip_actions,
+                )
+            except Exception as err:
+                print(
+                    f"{FAIL}The following error occurred when generating the parser."
+                    f" Please check your grammar file.\n{ENDC}",
+                    file=sys.stderr,
+                )
+                traceback.print_exception(err.__class__, err, None)
+
+                return 1
 
-        from pegen.tokenizer import Tokenizer
+        else:
+            print("A grammar file was not provided - attempting to use existing file...\n")
+            try:
+                sys.path.insert(0, sys.path.insert(0, os.path.join(os.getcwd(), "data")))
+                from python_parser import GeneratedParser
+            except:
+                print(
+                    "An existing parser was not found. Please run `make` or specify a grammar file with the `-g` flag.",
+                    file=sys.stderr,
+                )
+                return 1
+
+        if jobs > 1 and (parser or not grammar_file):
+            parser_path = sys.modules[GeneratedParser.__module__].__file__
+
+        return check_files(
+            directory,
+            GeneratedParser,
+            parser_path,
+            verbose,
+            excluded_files,
+            tree_arg,
+            short,
+            memo_profile,
+            jobs,
+            summary,
+            report,
+            slowest,
+            trace_memory,
+        )
 
-        def parse(filepath):
-            with open(filepath) as f:
-                tokengen = tokenize.generate_tokens(f.readline)
-                tokenizer = Tokenizer(tokengen, verbose=False)
-                parser = GeneratedParser(tokenizer, verbose=verbose)
-                return parser.start()
 
-    except:
-        print(
-            "An existing parser was not found. Please run `make` or specify a grammar file with the `-g` flag.",
-            file=sys.stderr,
-        )
-        return 1
+def check_files(
+    directory: str,
+    parser_class: Type[Parser],
+    parser_path: Optional[str],
+    verbose: bool,
+    excluded_files: List[str],
+    tree_arg: int,
+    short: bool,
+    memo_profile: Optional[str],
+    jobs: int,
+    summary: Optional[int],
+    report: Optional[str],
+    slowest: int,
+    trace_memory: bool,
+) -> int:
+    profile = MemoProfile() if memo_profile else None
+    # Results of every file without their output, with --report.
+    rows: List[FileResult] = []
+    total_lines = 0
+    total_bytes = 0
 
     # For a given directory, traverse files and attempt to parse each one
     # - Output success/failure for each file
     errors = 0
     files = []
-    trees = {}  # Trees to compare (after everything else is done)
-
-    t0 = time.time()
     for file in sorted(glob(f"{directory}/**/*.py", recursive=True)):
         # Only attempt to parse Python files and files that are not excluded
-        should_exclude_file = False
-        for pattern in excluded_files:
-            if PurePath(file).match(pattern):
-                should_exclude_file = True
-                break
+        if not any(PurePath(file).match(pattern) for pattern in excluded_files):
+            files.append(file)
+    compared_trees = 0
+    compare_trees_errors = 0
+    # Output of the first tree comparisons that failed, with --summary.
+    diffs: List[str] = []
 
-        if not should_exclude_file:
-            try:
-                if tree_arg:
-                    tree = parse(file)
-                    trees[file] = tree
+    t0 = time.time()
+    results: Iterator[FileResult]
+    if jobs > 1:
+        assert parser_path is not None
+        results = check_files_in_workers(
+            files,
+            parser_path,
+            parser_class.__name__,
+            jobs,
+            verbose,
+            tree_arg,
+            profile is not None,
+            trace_memory,
+        )
+    else:
+        if trace_memory:
+            tracemalloc.start()
+        parse = make_parse(parser_class, verbose, profile)
+        results = (check_file(file, parse, verbose, tree_arg) for file in files)
+
+    quiet = short or summary is not None
+    for result in results:
+        if result.succeeded:
+            if not quiet:
+                report_status(succeeded=True, file=result.file, verbose=verbose)
+        elif result.succeeded is None:
+            if not quiet:
+                print(f"File {result.file} cannot be parsed by either pegen or the ast module.")
+        else:
+            report_status(
+                succeeded=False,
+                file=result.file,
+                verbose=verbose,
+                error=result.error,
+                short=short,
+            )
+            errors += 1
+        if tree_arg and result.succeeded:
+            compared_trees += 1
+            compare_trees_errors += result.tree_errors
+            if summary is None:
                 if not short:
-                    report_status(succeeded=True, file=file, verbose=verbose)
-            except Exception as error:
-                try:
-                    with open(file) as f:
-                        ast.parse(f.read())
-                except Exception:
-                    if not short:
-                        print(f"File {file} cannot be parsed by either pegen or the ast module.")
-                else:
-                    report_status(
-                        succeeded=False, file=file, verbose=verbose, error=error, short=short
-                    )
-                    errors += 1
-            files.append(file)
+                    print("Comparing ASTs for", result.file)
+                print(result.output, end="")
+            elif result.tree_errors and len(diffs) < summary:
+                diffs.append(result.output)
+        if result.profile is not None and profile is not None:
+            worker_profile = MemoProfile()
+            worker_profile.rules = result.profile
+            profile.merge(worker_profile)
+        total_lines += result.lines
+        total_bytes += result.bytes
+        if report:
+            rows.append(result._replace(error=None, output="", profile=None))
     t1 = time.time()
+    if trace_memory and jobs == 1:
+        tracemalloc.stop()
 
     total_seconds = t1 - t0
     total_files = len(files)
 
-    total_bytes = 0
-    total_lines = 0
-    for file in files:
-        # Count lines and bytes separately
-        with open(file, "rb") as f:
-            total_lines += sum(1 for _ in f)
-            total_bytes += f.tell()
-
     print(
         f"Checked {total_files:,} files, {total_lines:,} lines,",
         f"{total_bytes:,} bytes in {total_seconds:,.3f} seconds.",
@@ -248,16 +593,23 @@ def parse_directory(
     if short:
         print_memstats()
 
+    if profile is not None:
+        profile.save(memo_profile)
+        print(f"Memo profile of {len(profile.rules)} rules written to {memo_profile}")
+
+    if report:
+        write_report(report, rows, slowest)
+        print(f"Report of {len(rows)} files written to {report}")
+
     if errors:
         print(f"Encountered {errors} failures.", file=sys.stderr)
 
-    # Compare trees (the dict is empty unless -t is given)
-    compare_trees_errors = 0
-    for file, tree in trees.items():
-        if not short:
-            print("Comparing ASTs for", file)
-        if compare_trees(tree, file, verbose, tree_arg >= 2) == 1:
-            compare_trees_errors += 1
+    if summary is not None and tree_arg:
+        for diff in diffs:
+            print(diff, end="")
+        print(f"Compared {compared_trees:,} trees, {compare_trees_errors:,} differ.")
+        if compare_trees_errors > len(diffs):
+            print(f"Only the first {len(diffs)} differences are shown.")
 
     if errors or compare_trees_errors:
         return 1
@@ -274,9 +626,26 @@ def main() -> None:
     skip_actions = args.skip_actions
     tree = args.tree
     short = args.short
+    if args.jobs < 1:
+        argparser.error("--jobs must be at least 1")
+    if skip_actions and tree:
+        argparser.error("--tree needs the trees built by the actions, not --skip-actions")
     sys.exit(
         parse_directory(
-            directory, grammar_file, verbose, excluded_files, skip_actions, tree, short, None
+            directory,
+            grammar_file,
+            verbose,
+            excluded_files,
+            skip_actions,
+            tree,
+            short,
+            None,
+            memo_profile=args.memo_profile,
+            jobs=args.jobs,
+            summary=args.summary,
+            report=args.report,
+            slowest=args.slowest,
+            trace_memory=args.trace_memory,
         )
     )
 
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3.8
+
+"""Time Tokenizer.get_last_non_whitespace_token on large inputs.
+
+Generated actions using LOCATIONS call get_last_non_whitespace_token after
+every successful alternative. This script tokenizes a file and queries the
+last non whitespace token at evenly spaced positions, comparing the tokenizer
+with the previous implementation, which scanned a copy of the consumed tokens
+backwards and therefore made parsing quadratic in the number of tokens.
+"""
+
+import argparse
+import io
+import sys
+import time
+import tokenize
+
+from pegen.tokenizer import Tokenizer
+
+argparser = argparse.ArgumentParser(
+    prog="tokenizer_timings",
+    description="Time the retrieval of the last non whitespace token",
+)
+argparser.add_argument("filename", nargs="?", default="data/xl.txt", help="File to tokenize")
+argparser.add_argument(
+    "-n", "--repeat", type=int, default=1, help="Concatenate the file N times (default 1)"
+)
+argparser.add_argument(
+    "-q", "--queries", type=int, default=1000, help="Number of queries to time (default 1000)"
+)
+
+
+def copying_get_last_non_whitespace_token(tokenizer: Tokenizer) -> tokenize.TokenInfo:
+    for tok in reversed(tokenizer._tokens[: tokenizer._index]):
+        if tok.type != tokenize.ENDMARKER and (
+            tok.type < tokenize.NEWLINE or tok.type > tokenize.DEDENT
+        ):
+            break
+    return tok
+
+
+def walk(tokenizer: Tokenizer, queries: int, tracked: bool) -> float:
+    step = max(len(tokenizer._tokens) // queries, 1)
+    t0 = time.perf_counter()
+    for index in range(1, len(tokenizer._tokens) + 1, step):
+        tokenizer.reset(index)
+        if tracked:
+            tokenizer.get_last_non_whitespace_token()
+        else:
+            copying_get_last_non_whitespace_token(tokenizer)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    args = argparser.parse_args()
+    with open(args.filename) as file:
+        source = file.read() * args.repeat
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+    while tokenizer.getnext().type != tokenize.ENDMARKER:
+        pass
+    nlines = source.count("\n")
+    print(f"{args.filename}: {nlines:,} lines, {len(tokenizer._tokens):,} tokens", file=sys.stderr)
+    for tracked, label in ((False, "copy of the token prefix"), (True, "tracked index")):
+        dt = walk(tokenizer, args.queries, tracked)
+        print(f"{label:>25}: {dt:.4f} sec; {dt / args.queries * 1e6:,.2f} usec/query")
+
+
+if __name__ == "__main__":
+    main()
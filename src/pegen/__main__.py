@@ -19,6 +19,7 @@ from pegen.build import (
     Tokenizer,
     build_python_parser_and_generator,
 )
+from pegen.memo_profile import MemoProfile
 from pegen.validator import validate_grammar
 
 
@@ -29,12 +30,24 @@ def generate_python_code(
     verbose_tokenizer = verbose >= 3
     verbose_parser = verbose == 2 or verbose >= 4
     try:
+        memo_profile = MemoProfile.from_file(args.memo_profile) if args.memo_profile else None
         grammar, parser, tokenizer, gen = build_python_parser_and_generator(
             args.grammar_filename,
             args.output,
             verbose_tokenizer,
             verbose_parser,
             skip_actions=args.skip_actions,
+            inline_memo=args.inline_memo,
+            memo_mode="profile" if memo_profile else args.memo,
+            memo_profile=memo_profile,
+            min_hit_rate=args.min_hit_rate,
+            specialize_literals=args.specialize_literals,
+            specialize_terminals=args.specialize_terminals,
+            first_set_guards=args.first_set_guards,
+            dispatch_tables=args.dispatch_tables,
+            local_aliases=args.local_aliases,
+            inline_lookaheads=args.inline_lookaheads,
+            loop_left_recursion=args.loop_left_recursion,
         )
         return grammar, parser, tokenizer, gen
     except Exception as err:
@@ -68,7 +81,66 @@ argparser.add_argument(
 argparser.add_argument(
     "--skip-actions",
     action="store_true",
-    help="Suppress code emission for rule actions",
+    help="Generate a recognizer whose rules return True instead of running their actions",
+)
+argparser.add_argument(
+    "--memo",
+    choices=["all", "flagged", "auto"],
+    default="all",
+    help="Memoize every rule (default), only rules marked with (memo), or rules that"
+    " may be re-entered at the same position",
+)
+argparser.add_argument(
+    "--memo-profile",
+    metavar="PROFILE",
+    help="Only memoize the rules with a high enough cache hit rate in a memo profile"
+    " (as written by scripts/test_parse_directory.py --memo-profile)",
+)
+argparser.add_argument(
+    "--min-hit-rate",
+    type=float,
+    default=0.1,
+    help="Cache hit rate required to memoize a rule with --memo-profile (default 0.1)",
+)
+argparser.add_argument(
+    "--inline-memo",
+    action="store_true",
+    help="Memoize rules in their body instead of using the memoize decorator (no verbose output)",
+)
+argparser.add_argument(
+    "--specialize-literals",
+    action="store_true",
+    help="Match keywords, operators and token types with dedicated unmemoized methods",
+)
+argparser.add_argument(
+    "--specialize-terminals",
+    action="store_true",
+    help="Match NAME, NUMBER, STRING, OP... tokens with unmemoized methods",
+)
+argparser.add_argument(
+    "--first-set-guards",
+    action="store_true",
+    help="Skip the alternatives of a rule that cannot start with the next token",
+)
+argparser.add_argument(
+    "--dispatch-tables",
+    action="store_true",
+    help="Select the alternatives of rules with many token-led alternatives with a table lookup",
+)
+argparser.add_argument(
+    "--local-aliases",
+    action="store_true",
+    help="Bind the parser methods called several times by a rule to locals",
+)
+argparser.add_argument(
+    "--inline-lookaheads",
+    action="store_true",
+    help="Test the next token in place of the lookaheads on tokens",
+)
+argparser.add_argument(
+    "--loop-left-recursion",
+    action="store_true",
+    help="Grow directly left-recursive rules by only matching their left-recursive alternatives",
 )
 
 
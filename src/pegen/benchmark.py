@@ -0,0 +1,329 @@
+"""Benchmark the parsers generated by pegen and compare benchmark results.
+
+The benchmarks generate parsers from grammars (data/python.gram and
+data/expr.gram by default) and time, over several runs following some warmup
+runs, how long generating each parser takes and how fast it parses the
+data/{tiny,small,medium,large,xl}.txt inputs. The Python parser parses every
+input as a file, the expression parser parses each of its lines.
+
+Results are saved as JSON, and two results can be compared: a benchmark is
+flagged when the difference of the mean times is statistically significant
+according to Welch's t-test and larger than a minimal relative change.
+
+    python -m pegen.benchmark run -o before.json
+    python -m pegen.benchmark run -o after.json --baseline before.json
+    python -m pegen.benchmark compare before.json after.json
+
+The benchmarks can also be run twice in a row, without and with a generator
+option, comparing for instance the recognizer to the full parser:
+
+    python -m pegen.benchmark run -g data/python.gram --compare-option skip_actions
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import tokenize
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from pegen.build import build_parser
+from pegen.parser import Parser
+from pegen.tokenizer import Tokenizer
+from pegen.utils import generate_parser
+
+FORMAT_VERSION = 1
+
+DEFAULT_INPUTS = ("tiny.txt", "small.txt", "medium.txt", "large.txt", "xl.txt")
+
+# Rule parsing the inputs of a grammar, and whether it parses one line at a time.
+ENTRY_POINTS: Dict[str, Tuple[str, bool]] = {
+    "python.gram": ("file", False),
+    "expr.gram": ("start", True),
+}
+
+# Two-sided critical values of Student's t distribution at the 5% level, by
+# degrees of freedom.
+T_CRITICAL = (
+    (1, 12.706),
+    (2, 4.303),
+    (3, 3.182),
+    (4, 2.776),
+    (5, 2.571),
+    (6, 2.447),
+    (7, 2.365),
+    (8, 2.306),
+    (9, 2.262),
+    (10, 2.228),
+    (12, 2.179),
+    (15, 2.131),
+    (20, 2.086),
+    (30, 2.042),
+    (60, 2.000),
+    (120, 1.980),
+    (1000, 1.962),
+)
+
+
+def generate(grammar_path: str, **options: Any) -> Type[Parser]:
+    grammar = build_parser(grammar_path)[0]
+    return generate_parser(
+        grammar, None, grammar.metas.get("class") or "GeneratedParser", **options
+    )
+
+
+def parse_source(parser_class: Type[Parser], source: str, rule: str) -> int:
+    """Parse a source with a rule, returning the number of tokens."""
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+    parser = parser_class(tokenizer)
+    if getattr(parser, rule)() is None:
+        raise parser.make_syntax_error("<benchmark>")
+    return len(tokenizer._tokens)
+
+
+def measure(function: Callable[[], Any], runs: int, warmup: int) -> Tuple[List[float], Any]:
+    """Time the runs of a function following its warmup runs."""
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def run_benchmarks(
+    grammars: Sequence[str],
+    inputs: Sequence[str],
+    runs: int = 5,
+    warmup: int = 1,
+    options: Optional[Dict[str, Any]] = None,
+    log: Callable[[str], None] = lambda message: None,
+) -> Dict[str, Any]:
+    """Run the benchmarks of some grammars over some inputs."""
+    options = options or {}
+    benchmarks: Dict[str, Dict[str, Any]] = {}
+    for grammar_path in grammars:
+        grammar_name = os.path.basename(grammar_path)
+        rule, by_line = ENTRY_POINTS.get(grammar_name, ("start", False))
+        log(f"Generating a parser from {grammar_path}")
+        times, parser_class = measure(lambda: generate(grammar_path, **options), runs, warmup)
+        benchmarks[f"{grammar_name}:generate"] = {"times": times}
+        for input_path in inputs:
+            with open(input_path) as file:
+                source = file.read()
+            sources = source.splitlines(keepends=True) if by_line else [source]
+            log(f"Parsing {input_path} with the parser of {grammar_name}")
+
+            def parse() -> int:
+                return sum(parse_source(parser_class, source, rule) for source in sources)
+
+            times, tokens = measure(parse, runs, warmup)
+            benchmarks[f"{grammar_name}:{os.path.basename(input_path)}"] = {
+                "times": times,
+                "lines": len(source.splitlines()),
+                "tokens": tokens,
+            }
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "runs": runs,
+        "warmup": warmup,
+        "options": options,
+        "benchmarks": benchmarks,
+    }
+
+
+def t_critical(degrees_of_freedom: float) -> float:
+    """Critical value for the largest tabulated degrees of freedom not above the given ones."""
+    value = T_CRITICAL[0][1]
+    for df, critical in T_CRITICAL:
+        if df > degrees_of_freedom:
+            break
+        value = critical
+    return value
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline: float
+    current: float
+    # Relative change of the mean time, positive when slower.
+    change: float
+    significant: bool
+
+    @property
+    def regression(self) -> bool:
+        return self.significant and self.change > 0
+
+
+def welch_significant(a: Sequence[float], b: Sequence[float]) -> bool:
+    """Whether the means of two samples differ according to Welch's t-test at 5%."""
+    if len(a) < 2 or len(b) < 2:
+        return False
+    var_a = statistics.variance(a) / len(a)
+    var_b = statistics.variance(b) / len(b)
+    if not var_a + var_b:
+        return statistics.mean(a) != statistics.mean(b)
+    t = abs(statistics.mean(a) - statistics.mean(b)) / math.sqrt(var_a + var_b)
+    df = (var_a + var_b) ** 2 / (var_a**2 / (len(a) - 1) + var_b**2 / (len(b) - 1))
+    return t > t_critical(df)
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any], min_change: float = 0.02
+) -> List[Comparison]:
+    """Compare the benchmarks present in two results.
+
+    A difference is significant if Welch's t-test says so and the mean time
+    changed by more than min_change (relative to the baseline).
+    """
+    comparisons = []
+    for name, bench in current["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        old_times = baseline["benchmarks"][name]["times"]
+        new_times = bench["times"]
+        old = statistics.mean(old_times)
+        new = statistics.mean(new_times)
+        change = (new - old) / old if old else 0.0
+        significant = abs(change) > min_change and welch_significant(old_times, new_times)
+        comparisons.append(Comparison(name, old, new, change, significant))
+    return comparisons
+
+
+def format_results(results: Dict[str, Any]) -> List[str]:
+    lines = [f"{'benchmark':30} {'mean':>10} {'stdev':>10} {'lines/s':>12} {'tokens/s':>12}"]
+    for name, bench in results["benchmarks"].items():
+        times = bench["times"]
+        mean = statistics.mean(times)
+        stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+        line = f"{name:30} {mean:10.4f} {stdev:10.4f}"
+        if "lines" in bench and mean:
+            line += f" {bench['lines'] / mean:12,.0f} {bench['tokens'] / mean:12,.0f}"
+        lines.append(line)
+    return lines
+
+
+def format_comparisons(comparisons: List[Comparison]) -> List[str]:
+    lines = [f"{'benchmark':30} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for comparison in comparisons:
+        flag = ""
+        if comparison.significant:
+            flag = "  REGRESSION" if comparison.regression else "  faster"
+        lines.append(
+            f"{comparison.name:30} {comparison.baseline:10.4f} {comparison.current:10.4f}"
+            f" {comparison.change:+8.1%}{flag}"
+        )
+    return lines
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as file:
+        results = json.load(file)
+    if results.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a benchmark result of version {FORMAT_VERSION}")
+    return results
+
+
+argparser = argparse.ArgumentParser(
+    prog="python -m pegen.benchmark", description="Benchmark the parsers generated by pegen"
+)
+subparsers = argparser.add_subparsers(dest="command", required=True)
+run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+run_parser.add_argument(
+    "-d", "--data-dir", default="data", help="Directory of the default grammars and inputs"
+)
+run_parser.add_argument(
+    "-g",
+    "--grammar",
+    action="append",
+    help="Grammar to benchmark (default: python.gram and expr.gram of the data directory)",
+)
+run_parser.add_argument(
+    "-i",
+    "--input",
+    action="append",
+    help="Input to parse (default: the tiny to xl .txt files of the data directory)",
+)
+run_parser.add_argument("-n", "--runs", type=int, default=5, help="Timed runs (default: 5)")
+run_parser.add_argument(
+    "-w", "--warmup", type=int, default=1, help="Untimed runs before them (default: 1)"
+)
+run_parser.add_argument(
+    "--option",
+    action="append",
+    default=[],
+    metavar="NAME",
+    help="Enable a boolean option of the generator, such as specialize_literals",
+)
+run_parser.add_argument(
+    "--compare-option",
+    action="append",
+    default=[],
+    metavar="NAME",
+    help="Run the benchmarks again with a boolean option of the generator and compare them",
+)
+run_parser.add_argument("-o", "--output", help="Where to write the results as JSON")
+run_parser.add_argument("--baseline", help="Results to compare the new results to")
+compare_parser = subparsers.add_parser("compare", help="Compare two saved results")
+compare_parser.add_argument("baseline")
+compare_parser.add_argument("current")
+for subparser in (run_parser, compare_parser):
+    subparser.add_argument(
+        "--min-change",
+        type=float,
+        default=0.02,
+        help="Smallest relative change of the mean time reported (default: 0.02)",
+    )
+
+
+def main() -> None:
+    args = argparser.parse_args()
+    if args.command == "run":
+        if args.runs < 1 or args.warmup < 0:
+            argparser.error("at least one run and no negative warmup are needed")
+        if args.compare_option and args.baseline:
+            argparser.error("--compare-option and --baseline cannot be used together")
+        grammars = args.grammar or [os.path.join(args.data_dir, name) for name in ENTRY_POINTS]
+        inputs = args.input or [os.path.join(args.data_dir, name) for name in DEFAULT_INPUTS]
+        options = dict.fromkeys(args.option, True)
+
+        def log(message: str) -> None:
+            print(message, file=sys.stderr)
+
+        results = run_benchmarks(grammars, inputs, args.runs, args.warmup, options, log=log)
+        print("\n".join(format_results(results)))
+        if args.compare_option:
+            baseline = results
+            options = {**options, **dict.fromkeys(args.compare_option, True)}
+            results = run_benchmarks(grammars, inputs, args.runs, args.warmup, options, log=log)
+            print("\n".join(format_results(results)))
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(results, file, indent=2)
+                file.write("\n")
+        if args.baseline:
+            baseline = load_results(args.baseline)
+        elif not args.compare_option:
+            return
+    else:
+        baseline = load_results(args.baseline)
+        results = load_results(args.current)
+
+    comparisons = compare_results(baseline, results, args.min_change)
+    print("\n".join(format_comparisons(comparisons)))
+    if any(comparison.regression for comparison in comparisons):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
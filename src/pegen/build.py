@@ -1,9 +1,18 @@
+import filecmp
+import functools
+import hashlib
+import io
+import os
 import pathlib
+import shutil
+import sys
+import tempfile
 import tokenize
-from typing import Dict, Set, Tuple
+from typing import Any, Dict, Optional, Set, Tuple
 
 from pegen.grammar import Grammar
 from pegen.grammar_parser import GeneratedParser as GrammarParser
+from pegen.memo_profile import MemoProfile
 from pegen.parser import Parser
 from pegen.parser_generator import ParserGenerator
 from pegen.python_generator import PythonParserGenerator
@@ -33,9 +42,12 @@ def build_python_generator(
     grammar_file: str,
     output_file: str,
     skip_actions: bool = False,
+    **options: Any,
 ) -> ParserGenerator:
     with open(output_file, "w") as file:
-        gen: ParserGenerator = PythonParserGenerator(grammar, file)  # TODO: skip_actions
+        gen: ParserGenerator = PythonParserGenerator(
+            grammar, file, skip_actions=skip_actions, **options
+        )
         gen.generate(grammar_file)
     return gen
 
@@ -46,6 +58,7 @@ def build_python_parser_and_generator(
     verbose_tokenizer: bool = False,
     verbose_parser: bool = False,
     skip_actions: bool = False,
+    **options: Any,
 ) -> Tuple[Grammar, Parser, Tokenizer, ParserGenerator]:
     """Generate rules, python parser, tokenizer, parser generator for a given grammar
 
@@ -56,7 +69,9 @@ def build_python_parser_and_generator(
           when generating the tokenizer. Defaults to False.
         verbose_parser (bool, optional): Whether to display additional output
           when generating the parser. Defaults to False.
-        skip_actions (bool, optional): Whether to pretend no rule has any actions.
+        skip_actions (bool, optional): Whether to generate a recognizer whose rules
+          return True instead of running their actions.
+        **options: Additional keyword arguments passed to PythonParserGenerator.
     """
     grammar, parser, tokenizer = build_parser(grammar_file, verbose_tokenizer, verbose_parser)
     gen = build_python_generator(
@@ -64,5 +79,122 @@ def build_python_parser_and_generator(
         grammar_file,
         output_file,
         skip_actions=skip_actions,
+        **options,
     )
     return grammar, parser, tokenizer, gen
+
+
+@functools.lru_cache(maxsize=None)
+def generator_fingerprint() -> str:
+    """Hash of the pegen version, its sources and the Python version.
+
+    Generated parsers depend on all of them, so it is part of the keys of the
+    cached parsers. Hashing the sources also covers development checkouts
+    whose version does not change with every edit.
+    """
+    digest = hashlib.sha256()
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+
+        digest.update(version("pegen").encode())
+    except (ImportError, PackageNotFoundError):
+        pass
+    digest.update(repr(sys.version_info[:2]).encode())
+    for path in sorted(MOD_DIR.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _option_repr(value: Any) -> str:
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value))
+    if isinstance(value, MemoProfile):
+        profile = io.StringIO()
+        value.dump(profile)
+        return profile.getvalue()
+    return repr(value)
+
+
+def cache_key(grammar_source: str, filename: str = "<string>", **options: Any) -> str:
+    """Key of the parser generated from a grammar text with some generator options."""
+    digest = hashlib.sha256(generator_fingerprint().encode())
+    for part in (grammar_source, filename):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    for name, value in sorted(options.items()):
+        digest.update(f"{name}={_option_repr(value)}\0".encode())
+    return digest.hexdigest()
+
+
+def default_cache_dir() -> pathlib.Path:
+    """Directory of the cached parsers: $PEGEN_CACHE_DIR or the pegen user cache directory."""
+    if os.environ.get("PEGEN_CACHE_DIR"):
+        return pathlib.Path(os.environ["PEGEN_CACHE_DIR"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return pathlib.Path(cache_home) / "pegen"
+
+
+def cached_python_parser(
+    grammar_source: str,
+    filename: str = "<string>",
+    cache_dir: Optional[str] = None,
+    **options: Any,
+) -> str:
+    """Return the path of the Python parser generated from a grammar text.
+
+    The parser is only generated if the cache directory does not hold one for
+    the same grammar text, file name, generator options and pegen version.
+
+    Args:
+        grammar_source (string): Text of the grammar
+        filename (string, optional): Name of the grammar given to the generator.
+        cache_dir (string, optional): Where to store the generated parsers.
+          Defaults to default_cache_dir().
+        **options: Additional keyword arguments passed to PythonParserGenerator.
+    """
+    directory = pathlib.Path(cache_dir) if cache_dir is not None else default_cache_dir()
+    path = directory / f"parser_{cache_key(grammar_source, filename, **options)}.py"
+    if path.exists():
+        return str(path)
+
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(grammar_source).readline))
+    parser = GrammarParser(tokenizer)
+    grammar = parser.start()
+    if not grammar:
+        raise parser.make_syntax_error(filename)
+    directory.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that concurrent builds never see a
+    # partially written parser.
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, prefix=".parser_", suffix=".py", delete=False
+    ) as file:
+        try:
+            PythonParserGenerator(grammar, file, **options).generate(filename)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+    return str(path)
+
+
+def build_cached_python_parser(
+    grammar_file: str,
+    output_file: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    **options: Any,
+) -> str:
+    """Generate the Python parser of a grammar file unless it is in the cache.
+
+    The parser is copied to output_file if given (it is not written again if
+    it did not change), and the path of the parser is returned.
+    """
+    with open(grammar_file) as file:
+        grammar_source = file.read()
+    path = cached_python_parser(grammar_source, grammar_file, cache_dir, **options)
+    if output_file is None:
+        return path
+    if not os.path.exists(output_file) or not filecmp.cmp(path, output_file, shallow=False):
+        shutil.copyfile(path, output_file)
+    return output_file
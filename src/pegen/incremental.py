@@ -0,0 +1,249 @@
+"""Parse a source again after an edit, reusing the results of the previous parse.
+
+Editors parse the same file after every keystroke. An IncrementalParser keeps
+the tokens and the memoization cache of the last parse of a source and, given
+an edit, only keeps the parts of them that the edit cannot have changed:
+
+- the tokens before and after the edited region are the same in both sources,
+  so the memoized results of the rules that only looked at the tokens before
+  the edit are kept as they are;
+- the results of the rules invoked after the edited region are kept too, with
+  their positions shifted by the number of tokens the edit added or removed.
+  Since the trees built by the actions carry line numbers, this is only done
+  when the edit does not add or remove lines;
+- everything else is dropped, and parsing the new source only evaluates again
+  the rules whose results were dropped.
+
+The new source is tokenized with pegen.tokenizer.retokenize, which only
+tokenizes again the lines around the edit.
+
+To know which tokens the result of a rule depends on, the cache records with
+every entry the furthest token peeked by the parser when the entry was stored.
+This is an over-approximation of the tokens looked at by the rule, so some
+entries are dropped needlessly but none is kept wrongly.
+"""
+
+import io
+import tokenize
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from pegen.parser import MemoEntry, MemoKey, Parser
+from pegen.tokenizer import Mark, Tokenizer, retokenize
+
+Position = Tuple[int, int]  # (line, column) as in tokenize, lines start at 1
+
+
+class _TrackingTokenizer(Tokenizer):
+    """Tokenizer over a complete list of tokens recording the furthest token peeked."""
+
+    def __init__(self, tokens: List[tokenize.TokenInfo]) -> None:
+        super().__init__(iter(tokens))
+        for _ in tokens:
+            self._index = len(self._tokens)
+            Tokenizer.peek(self)
+        self._index = 0
+        self.furthest: Mark = 0
+
+    def peek(self) -> tokenize.TokenInfo:
+        if self._index > self.furthest:
+            self.furthest = self._index
+        return self._tokens[self._index]
+
+    def diagnose(self) -> tokenize.TokenInfo:
+        # All the tokens are already there: report the last one a lazy
+        # tokenizer would have produced.
+        return self._tokens[self.furthest]
+
+
+class _HighWaterCache(Dict[MemoKey, MemoEntry]):
+    """Memo cache recording the furthest token peeked when each entry was stored."""
+
+    def __init__(self, tokenizer: _TrackingTokenizer) -> None:
+        super().__init__()
+        self._tokenizer = tokenizer
+        self.high_water: Dict[MemoKey, Mark] = {}
+
+    def __getitem__(self, key: MemoKey) -> MemoEntry:
+        value = super().__getitem__(key)
+        # Reusing an entry stands for peeking the tokens it depends on.
+        high_water = self.high_water[key]
+        if high_water > self._tokenizer.furthest:
+            self._tokenizer.furthest = high_water
+        return value
+
+    def get(self, key: MemoKey, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key: MemoKey, value: MemoEntry) -> None:
+        super().__setitem__(key, value)
+        self.high_water[key] = self._tokenizer.furthest
+
+    def __delitem__(self, key: MemoKey) -> None:
+        super().__delitem__(key)
+        del self.high_water[key]
+
+    def clear(self) -> None:
+        super().clear()
+        self.high_water.clear()
+
+
+def _tokenize(source: str) -> List[tokenize.TokenInfo]:
+    """Return the tokens the parser would see for a source."""
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+    while tokenizer.getnext().type != tokenize.ENDMARKER:
+        pass
+    return tokenizer._tokens  # type: ignore
+
+
+def _call_start(parser: Parser) -> Any:
+    return parser.start()
+
+
+class IncrementalParser:
+    """Parse a source and parse it again after every edit.
+
+    ``start`` is called with a parser to get the tree (the ``start`` rule is
+    used by default, pass ``lambda parser: parser.parse("file")`` for the Python
+    grammar). The other keyword arguments are given to the parser class.
+    Parsers using a ``PackedMemoTable`` are not supported.
+    """
+
+    def __init__(
+        self,
+        parser_class: Type[Parser],
+        source: str = "",
+        *,
+        start: Callable[[Parser], Any] = _call_start,
+        **parser_options: Any,
+    ) -> None:
+        if parser_class.packed_memo:
+            raise ValueError("Incremental parsing does not support packed_memo parsers")
+        self.parser_class = parser_class
+        self.source = source
+        self.start = start
+        self.parser_options = parser_options
+        self.tokens: List[tokenize.TokenInfo] = []
+        #: Number of cache entries kept from the previous parse by the last edit.
+        self.reused_entries = 0
+        self._cache: Optional[_HighWaterCache] = None
+
+    def parse(self) -> Any:
+        """Parse the whole source, discarding the results of previous parses."""
+        self.tokens = []
+        self._cache = None
+        return self._reparse(self.source, 0, None)
+
+    def edit(self, start: Position, end: Position, text: str) -> Any:
+        """Replace the text between two positions and parse the new source.
+
+        Positions are ``(line, column)`` pairs as in the tokens: lines start at
+        1 and columns at 0.
+        """
+        start_offset = self.offset(start)
+        end_offset = self.offset(end)
+        if start_offset > end_offset:
+            raise ValueError(f"Edit ends at {end} before its start {start}")
+        line_delta = text.count("\n") - self.source.count("\n", start_offset, end_offset)
+        source = self.source[:start_offset] + text + self.source[end_offset:]
+        return self._reparse(source, line_delta, (start[0], end[0]))
+
+    def offset(self, position: Position) -> int:
+        """Convert a position in the current source to an offset."""
+        line, column = position
+        offset = 0
+        for _ in range(line - 1):
+            offset = self.source.find("\n", offset) + 1
+            if not offset:
+                raise ValueError(f"Line {line} is past the end of the source")
+        line_end = self.source.find("\n", offset)
+        if not 0 <= column <= (len(self.source) if line_end < 0 else line_end) - offset:
+            raise ValueError(f"Column {column} is outside of line {line}")
+        return offset + column
+
+    def _reparse(
+        self, source: str, line_delta: int, edited_lines: Optional[Tuple[int, int]]
+    ) -> Any:
+        self.source = source
+        try:
+            if self.tokens and edited_lines is not None:
+                tokens = retokenize(self.tokens, source, *edited_lines, line_delta)
+            else:
+                tokens = _tokenize(source)
+        except (tokenize.TokenError, SyntaxError):
+            # Let a normal parse report the error where it would be found.
+            self.tokens = []
+            self._cache = None
+            self.reused_entries = 0
+            tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+            return self.start(self.parser_class(tokenizer, **self.parser_options))
+
+        cache = self._update_cache(tokens, line_delta)
+        self.tokens = tokens
+        self.reused_entries = len(cache) if cache is not None else 0
+        if self.reused_entries:
+            try:
+                tree = self._run(cache)
+            except SyntaxError:
+                tree = None
+            if tree is not None:
+                return tree
+            # The errors are reported from the furthest token reached: parse
+            # again from scratch so that they are the same as for a new parse.
+            self.reused_entries = 0
+        return self._run(None)
+
+    def _run(self, cache: Optional[_HighWaterCache]) -> Any:
+        tokenizer = _TrackingTokenizer(self.tokens)
+        parser = self.parser_class(tokenizer, **self.parser_options)
+        if cache is None:
+            cache = _HighWaterCache(tokenizer)
+        else:
+            cache._tokenizer = tokenizer
+        parser._cache = self._cache = cache
+        try:
+            tree = self.start(parser)
+        except SyntaxError:
+            # The results of the second pass of the Python parser depend on
+            # the invalid rules being called.
+            parser.forget_rules(parser.INVALID_SENSITIVE_RULES)
+            raise
+        if tree is None:
+            parser.forget_rules(parser.INVALID_SENSITIVE_RULES)
+        return tree
+
+    def _update_cache(
+        self, tokens: List[tokenize.TokenInfo], line_delta: int
+    ) -> Optional[_HighWaterCache]:
+        """Drop the cache entries the new tokens invalidate and shift the ones after them."""
+        old_tokens = self.tokens
+        cache = self._cache
+        if cache is None or not old_tokens:
+            return None
+        limit = min(len(old_tokens), len(tokens))
+        prefix = 0
+        while prefix < limit and old_tokens[prefix] == tokens[prefix]:
+            prefix += 1
+        suffix = 0
+        if not line_delta:
+            while suffix < limit - prefix and old_tokens[-1 - suffix] == tokens[-1 - suffix]:
+                suffix += 1
+        suffix_start = len(old_tokens) - suffix
+        delta = len(tokens) - len(old_tokens)
+
+        high_water = cache.high_water
+        for key in [
+            key for key, mark in high_water.items() if mark >= prefix and key[0] < suffix_start
+        ]:
+            del cache[key]
+        if delta:
+            moved = [
+                (key, dict.pop(cache, key), high_water.pop(key))
+                for key in [key for key in high_water if key[0] >= suffix_start]
+            ]
+            for (mark, name, args), (tree, endmark), furthest in moved:
+                key = mark + delta, name, args
+                dict.__setitem__(cache, key, (tree, endmark + delta))
+                high_water[key] = furthest + delta
+        return cache
@@ -0,0 +1,107 @@
+"""Collect per-rule statistics about the memoization cache of parsers.
+
+A profile records, for every memoized rule, how many times a cached result was
+reused (hits), how many times the rule had to be evaluated at a new position
+(misses) and how many entries were written to the cache (stores, which exceed
+misses for left-recursive rules). The profile can be saved as JSON and given
+back to the generator, which then only memoizes the rules whose hit rate
+justifies the cost of the cache.
+"""
+
+import json
+from typing import IO, Any, Callable, Dict, Hashable, Optional
+
+from pegen.parser import PackedMemoTable, Parser, _rule_names
+
+COUNTERS = ("hits", "misses", "stores")
+
+
+class _CountingCache(Dict[Any, Any]):
+    """Memo cache recording its accesses in a MemoProfile."""
+
+    def __init__(self, profile: "MemoProfile", rule_of: Callable[[Any], str]) -> None:
+        super().__init__()
+        self._profile = profile
+        self._rule_of = rule_of
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = super().__getitem__(key)
+        self._profile.count(self._rule_of(key), "hits")
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        rule = self._rule_of(key)
+        if key not in self:
+            self._profile.count(rule, "misses")
+        self._profile.count(rule, "stores")
+        super().__setitem__(key, value)
+
+
+def _rule_of_key(key: Any) -> str:
+    return key[1]
+
+
+def _rule_of_slot(slot: Any) -> str:
+    return _rule_names[slot[0] if isinstance(slot, tuple) else slot]
+
+
+class MemoProfile:
+    """Hits, misses and stores of the memoization cache, per rule."""
+
+    def __init__(self) -> None:
+        self.rules: Dict[str, Dict[str, int]] = {}
+
+    def count(self, rule: str, counter: str) -> None:
+        counters = self.rules.get(rule)
+        if counters is None:
+            counters = self.rules[rule] = dict.fromkeys(COUNTERS, 0)
+        counters[counter] += 1
+
+    def instrument(self, parser: Parser) -> None:
+        """Record the cache accesses of a parser that has not started parsing."""
+        if isinstance(parser._cache, PackedMemoTable):
+            parser._cache.row_factory = lambda: _CountingCache(self, _rule_of_slot)
+        else:
+            parser._cache = _CountingCache(self, _rule_of_key)
+
+    def hit_rate(self, rule: str) -> Optional[float]:
+        """Fraction of the lookups of a rule answered by the cache.
+
+        None is returned for rules that were never looked up.
+        """
+        counters = self.rules.get(rule)
+        if not counters:
+            return None
+        lookups = counters["hits"] + counters["misses"]
+        return counters["hits"] / lookups if lookups else None
+
+    def merge(self, other: "MemoProfile") -> None:
+        for rule, counters in other.rules.items():
+            for counter, value in counters.items():
+                self.rules.setdefault(rule, dict.fromkeys(COUNTERS, 0))[counter] += value
+
+    def dump(self, file: IO[str]) -> None:
+        json.dump({"rules": self.rules}, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+    @classmethod
+    def load(cls, file: IO[str]) -> "MemoProfile":
+        profile = cls()
+        data = json.load(file)
+        for rule, counters in data["rules"].items():
+            profile.rules[rule] = {counter: int(counters.get(counter, 0)) for counter in COUNTERS}
+        return profile
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            self.dump(file)
+
+    @classmethod
+    def from_file(cls, path: str) -> "MemoProfile":
+        with open(path) as file:
+            return cls.load(file)
@@ -6,7 +6,23 @@ import token
 import tokenize
 import traceback
 from abc import abstractmethod
-from typing import Any, Callable, ClassVar, Dict, Optional, Tuple, Type, TypeVar, cast
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+    overload,
+)
 
 from pegen.tokenizer import Mark, Tokenizer, exact_token_types
 
@@ -19,6 +35,98 @@ FSTRING_START = getattr(token, "FSTRING_START", None)
 FSTRING_MIDDLE = getattr(token, "FSTRING_MIDDLE", None)
 FSTRING_END = getattr(token, "FSTRING_END", None)
 
+MemoKey = Tuple[Mark, str, Tuple[Any, ...]]
+MemoEntry = Tuple[Any, Mark]
+
+# Rule names interned to small integers, shared by all packed memo tables.
+_rule_ids: Dict[str, int] = {}
+_rule_names: List[str] = []
+
+
+def intern_rule(name: str) -> int:
+    """Return the integer id identifying a rule in packed memo tables."""
+    rule_id = _rule_ids.get(name)
+    if rule_id is None:
+        rule_id = _rule_ids[name] = len(_rule_names)
+        _rule_names.append(name)
+    return rule_id
+
+
+class PackedMemoTable:
+    """Memo table storing a small dict of results per token position.
+
+    Rows live in a list indexed by mark and each row maps the interned id of
+    a rule (or ``(id, args)`` for rules taking arguments) to ``(tree, endmark)``.
+    Unlike the default dict keyed by ``(mark, name, args)`` no key tuple is
+    built on lookup, and the size of the table grows linearly with the number
+    of tokens.
+
+    The table also supports the mapping operations of the default cache, using
+    ``(mark, name, args)`` keys, for code that inspects the cache.
+    """
+
+    def __init__(self) -> None:
+        self._rows: List[Optional[Dict[Any, MemoEntry]]] = []
+        self.row_factory: Callable[[], Dict[Any, MemoEntry]] = dict
+
+    def row(self, mark: Mark) -> Dict[Any, MemoEntry]:
+        """Return the entries for ``mark``, creating the row if needed."""
+        rows = self._rows
+        if mark < len(rows):
+            row = rows[mark]
+            if row is not None:
+                return row
+        else:
+            # Grow geometrically so that growth is amortized over the tokens.
+            rows.extend([None] * max(mark + 1 - len(rows), len(rows)))
+        row = rows[mark] = self.row_factory()
+        return row
+
+    @staticmethod
+    def slot(name: str, args: Tuple[Any, ...] = ()) -> Any:
+        """Return the key of the results of a rule in the rows."""
+        rule_id = intern_rule(name)
+        return (rule_id, args) if args else rule_id
+
+    def __contains__(self, key: MemoKey) -> bool:
+        mark, name, args = key
+        row = self._rows[mark] if mark < len(self._rows) else None
+        return row is not None and self.slot(name, args) in row
+
+    def __getitem__(self, key: MemoKey) -> MemoEntry:
+        mark, name, args = key
+        if key not in self:
+            raise KeyError(key)
+        return self.row(mark)[self.slot(name, args)]
+
+    def get(self, key: MemoKey, default: Optional[MemoEntry] = None) -> Optional[MemoEntry]:
+        return self[key] if key in self else default
+
+    def __setitem__(self, key: MemoKey, value: MemoEntry) -> None:
+        mark, name, args = key
+        self.row(mark)[self.slot(name, args)] = value
+
+    def __delitem__(self, key: MemoKey) -> None:
+        mark, name, args = key
+        if key not in self:
+            raise KeyError(key)
+        del self.row(mark)[self.slot(name, args)]
+
+    def __iter__(self) -> Iterator[MemoKey]:
+        for mark, row in enumerate(self._rows):
+            if row:
+                for slot in list(row):
+                    if isinstance(slot, tuple):
+                        yield mark, _rule_names[slot[0]], slot[1]
+                    else:
+                        yield mark, _rule_names[slot], ()
+
+    def __len__(self) -> int:
+        return sum(len(row) for row in self._rows if row)
+
+    def clear(self) -> None:
+        self._rows.clear()
+
 
 def logger(method: F) -> F:
     """For non-memoized functions that we want to be logged.
@@ -46,20 +154,27 @@ def logger(method: F) -> F:
 def memoize(method: F) -> F:
     """Memoize a symbol method."""
     method_name = method.__name__
+    rule_id = intern_rule(method_name)
 
     def memoize_wrapper(self: P, *args: object) -> F:
         mark = self._mark()
-        key = mark, method_name, args
+        cache: Dict[Any, MemoEntry]
+        if self.packed_memo:
+            cache = self._cache.row(mark)  # type: ignore
+            key: Any = (rule_id, args) if args else rule_id
+        else:
+            cache = self._cache  # type: ignore
+            key = mark, method_name, args
         # Fast path: cache hit, and not verbose.
-        if key in self._cache and not self._verbose:
-            tree, endmark = self._cache[key]
+        if key in cache and not self._verbose:
+            tree, endmark = cache[key]
             self._reset(endmark)
             return tree
         # Slow path: no cache hit, or verbose.
         verbose = self._verbose
         argsr = ",".join(repr(arg) for arg in args)
         fill = "  " * self._level
-        if key not in self._cache:
+        if key not in cache:
             if verbose:
                 print(f"{fill}{method_name}({argsr}) ... (looking at {self.showpeek()})")
             self._level += 1
@@ -68,9 +183,9 @@ def memoize(method: F) -> F:
             if verbose:
                 print(f"{fill}... {method_name}({argsr}) -> {tree!s:.200}")
             endmark = self._mark()
-            self._cache[key] = tree, endmark
+            cache[key] = tree, endmark
         else:
-            tree, endmark = self._cache[key]
+            tree, endmark = cache[key]
             if verbose:
                 print(f"{fill}{method_name}({argsr}) -> {tree!s:.200}")
             self._reset(endmark)
@@ -80,22 +195,102 @@ def memoize(method: F) -> F:
     return cast(F, memoize_wrapper)
 
 
-def memoize_left_rec(method: Callable[[P], Optional[T]]) -> Callable[[P], Optional[T]]:
-    """Memoize a left-recursive symbol method."""
+def _grow_left_rec(
+    parser: P,
+    method: Callable[[P], Optional[T]],
+    tail: Optional[str],
+    cache: Dict[Any, MemoEntry],
+    key: Any,
+    mark: Mark,
+    fill: str,
+) -> Tuple[Optional[T], Mark]:
+    """Grow the seed of a left-recursive rule until it does not progress anymore.
+
+    Return the last result that progressed and the mark after it.
+    """
     method_name = method.__name__
+    verbose = parser._verbose
+    lastresult: Optional[T] = None
+    lastmark = mark
+    depth = 0
+    if verbose:
+        print(f"{fill}Recursive {method_name} at {mark} depth {depth}")
+
+    grow = method
+    while True:
+        parser._reset(mark)
+        parser.in_recursive_rule += 1
+        try:
+            result = grow(parser)
+        finally:
+            parser.in_recursive_rule -= 1
+        endmark = parser._mark()
+        depth += 1
+        if verbose:
+            print(
+                f"{fill}Recursive {method_name} at {mark} depth {depth}: {result!s:.200} to {endmark}"
+            )
+        if not result:
+            if verbose:
+                print(f"{fill}Fail with {lastresult!s:.200} to {lastmark}")
+            break
+        if endmark <= lastmark:
+            if verbose:
+                print(f"{fill}Bailing with {lastresult!s:.200} to {lastmark}")
+            break
+        cache[key] = lastresult, lastmark = result, endmark
+        if tail is not None and grow is method:
+            grow = getattr(type(parser), tail)
+    return lastresult, lastmark
+
+
+@overload
+def memoize_left_rec(
+    method: Callable[[P], Optional[T]], *, tail: Optional[str] = None
+) -> Callable[[P], Optional[T]]:
+    ...
+
+
+@overload
+def memoize_left_rec(
+    *, tail: str
+) -> Callable[[Callable[[P], Optional[T]]], Callable[[P], Optional[T]]]:
+    ...
+
+
+def memoize_left_rec(
+    method: Optional[Callable[[P], Optional[T]]] = None, *, tail: Optional[str] = None
+) -> Any:
+    """Memoize a left-recursive symbol method.
+
+    With tail, the method only matches the alternatives that are not
+    left-recursive, and the seed it returns is grown by calling the method
+    named tail, which only matches the left-recursive ones, rather than by
+    matching every alternative again.
+    """
+    if method is None:
+        return lambda method: memoize_left_rec(method, tail=tail)
+    method_name = method.__name__
+    rule_id = intern_rule(method_name)
 
     def memoize_left_rec_wrapper(self: P) -> Optional[T]:
         mark = self._mark()
-        key = mark, method_name, ()
+        cache: Dict[Any, MemoEntry]
+        if self.packed_memo:
+            cache = self._cache.row(mark)  # type: ignore
+            key: Any = rule_id
+        else:
+            cache = self._cache  # type: ignore
+            key = mark, method_name, ()
         # Fast path: cache hit, and not verbose.
-        if key in self._cache and not self._verbose:
-            tree, endmark = self._cache[key]
+        if key in cache and not self._verbose:
+            tree, endmark = cache[key]
             self._reset(endmark)
             return tree
         # Slow path: no cache hit, or verbose.
         verbose = self._verbose
         fill = "  " * self._level
-        if key not in self._cache:
+        if key not in cache:
             if verbose:
                 print(f"{fill}{method_name} ... (looking at {self.showpeek()})")
             self._level += 1
@@ -109,37 +304,9 @@ def memoize_left_rec(method: Callable[[P], Optional[T]]) -> Callable[[P], Option
             # (http://web.cs.ucla.edu/~todd/research/pub.php?id=pepm08).
 
             # Prime the cache with a failure.
-            self._cache[key] = None, mark
-            lastresult, lastmark = None, mark
-            depth = 0
-            if verbose:
-                print(f"{fill}Recursive {method_name} at {mark} depth {depth}")
-
-            while True:
-                self._reset(mark)
-                self.in_recursive_rule += 1
-                try:
-                    result = method(self)
-                finally:
-                    self.in_recursive_rule -= 1
-                endmark = self._mark()
-                depth += 1
-                if verbose:
-                    print(
-                        f"{fill}Recursive {method_name} at {mark} depth {depth}: {result!s:.200} to {endmark}"
-                    )
-                if not result:
-                    if verbose:
-                        print(f"{fill}Fail with {lastresult!s:.200} to {lastmark}")
-                    break
-                if endmark <= lastmark:
-                    if verbose:
-                        print(f"{fill}Bailing with {lastresult!s:.200} to {lastmark}")
-                    break
-                self._cache[key] = lastresult, lastmark = result, endmark
-
+            cache[key] = None, mark
+            tree, lastmark = _grow_left_rec(self, method, tail, cache, key, mark, fill)
             self._reset(lastmark)
-            tree = lastresult
 
             self._level -= 1
             if verbose:
@@ -149,9 +316,9 @@ def memoize_left_rec(method: Callable[[P], Optional[T]]) -> Callable[[P], Option
             else:
                 endmark = mark
                 self._reset(endmark)
-            self._cache[key] = tree, endmark
+            cache[key] = tree, endmark
         else:
-            tree, endmark = self._cache[key]
+            tree, endmark = cache[key]
             if verbose:
                 print(f"{fill}{method_name}() -> {tree!s:.200} [fresh]")
             if tree:
@@ -169,11 +336,26 @@ class Parser:
 
     SOFT_KEYWORDS: ClassVar[Tuple[str, ...]]
 
+    # Frozen sets of the keywords, computed for every subclass.
+    _keywords: ClassVar[FrozenSet[str]] = frozenset()
+
+    _soft_keywords: ClassVar[FrozenSet[str]] = frozenset()
+
+    #: Rules whose results may change when invalid rules are called, that is
+    #: the rules that can reach an ``invalid_*`` rule. None if unknown.
+    INVALID_SENSITIVE_RULES: ClassVar[Optional[FrozenSet[str]]] = None
+
+    #: Store memoized results in a PackedMemoTable rather than in a dict
+    #: keyed by ``(mark, name, args)`` tuples.
+    packed_memo: ClassVar[bool] = False
+
     def __init__(self, tokenizer: Tokenizer, *, verbose: bool = False):
         self._tokenizer = tokenizer
         self._verbose = verbose
         self._level = 0
-        self._cache: Dict[Tuple[Mark, str, Tuple[Any, ...]], Tuple[Any, Mark]] = {}
+        self._cache: Union[Dict[MemoKey, MemoEntry], PackedMemoTable] = (
+            PackedMemoTable() if self.packed_memo else {}
+        )
 
         # Integer tracking wether we are in a left recursive rule or not. Can be useful
         # for error reporting.
@@ -186,6 +368,15 @@ class Parser:
         # Are we looking for syntax error ? When true enable matching on invalid rules
         self.call_invalid_rules = False
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._keywords = frozenset(getattr(cls, "KEYWORDS", ()))
+        cls._soft_keywords = frozenset(getattr(cls, "SOFT_KEYWORDS", ()))
+        # The rules memoized in their body read their key in the rows of the
+        # packed memo table from a class attribute.
+        for name in getattr(cls, "INLINE_MEMO_RULES", ()):
+            setattr(cls, f"_slot_{name}", intern_rule(name))
+
     @abstractmethod
     def start(self) -> Any:
         """Expected grammar entry point.
@@ -196,6 +387,14 @@ class Parser:
         """
         pass
 
+    def forget_rules(self, rules: Optional[AbstractSet[str]]) -> None:
+        """Drop the memoized results of some rules, or of all rules if None."""
+        if rules is None:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if key[1] in rules]:
+            del self._cache[key]
+
     def showpeek(self) -> str:
         tok = self._tokenizer.peek()
         return f"{tok.start[0]}.{tok.start[1]}: {token.tok_name[tok.type]}:{tok.string!r}"
@@ -203,7 +402,7 @@ class Parser:
     @memoize
     def name(self) -> Optional[tokenize.TokenInfo]:
         tok = self._tokenizer.peek()
-        if tok.type == token.NAME and tok.string not in self.KEYWORDS:
+        if tok.type == token.NAME and tok.string not in self._keywords:
             return self._tokenizer.getnext()
         return None
 
@@ -259,7 +458,7 @@ class Parser:
     @memoize
     def soft_keyword(self) -> Optional[tokenize.TokenInfo]:
         tok = self._tokenizer.peek()
-        if tok.type == token.NAME and tok.string in self.SOFT_KEYWORDS:
+        if tok.type == token.NAME and tok.string in self._soft_keywords:
             return self._tokenizer.getnext()
         return None
 
@@ -278,6 +477,41 @@ class Parser:
             return self._tokenizer.getnext()
         return None
 
+    # The following matchers are selected by the generator for each literal of
+    # the grammar when it specializes literals. They are not memoized since
+    # comparing a single token is cheaper than a cache lookup.
+
+    def expect_string(self, string: str) -> Optional[tokenize.TokenInfo]:
+        if self._tokenizer.peek().string == string:
+            return self._tokenizer.getnext()
+        return None
+
+    def expect_operator(self, string: str, type: int) -> Optional[tokenize.TokenInfo]:
+        tok = self._tokenizer.peek()
+        if tok.string == string or tok.type == type:
+            return self._tokenizer.getnext()
+        return None
+
+    def expect_type(self, type: int) -> Optional[tokenize.TokenInfo]:
+        if self._tokenizer.peek().type == type:
+            return self._tokenizer.getnext()
+        return None
+
+    # Unmemoized equivalents of name and soft_keyword, used together with
+    # expect_type for the terminals of the grammar when they are specialized.
+
+    def expect_name(self) -> Optional[tokenize.TokenInfo]:
+        tok = self._tokenizer.peek()
+        if tok.type == token.NAME and tok.string not in self._keywords:
+            return self._tokenizer.getnext()
+        return None
+
+    def expect_soft_keyword(self) -> Optional[tokenize.TokenInfo]:
+        tok = self._tokenizer.peek()
+        if tok.type == token.NAME and tok.string in self._soft_keywords:
+            return self._tokenizer.getnext()
+        return None
+
     def expect_forced(self, res: Any, expectation: str) -> Optional[tokenize.TokenInfo]:
         if res is None:
             raise self.make_syntax_error(f"expected {expectation}")
@@ -1,6 +1,20 @@
+import ast
 import contextlib
+import token
 from abc import abstractmethod
-from typing import Any, IO, AbstractSet, Dict, Iterator, List, Optional, Set, Text, Tuple
+from typing import (
+    Any,
+    IO,
+    AbstractSet,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Text,
+    Tuple,
+)
 
 from pegen import sccutils
 from pegen.grammar import (
@@ -23,6 +37,12 @@ from pegen.grammar import (
     Rule,
     StringLeaf,
 )
+from pegen.tokenizer import exact_token_types
+
+# The tokens that may follow the current position when an item succeeds, as
+# ("string", value) and ("type", token name) pairs, or None when they are
+# unknown (the item may have an effect without consuming any token).
+FirstSet = Optional[FrozenSet[Tuple[str, str]]]
 
 
 class RuleCheckingVisitor(GrammarVisitor):
@@ -238,6 +258,116 @@ def compute_nullables(rules: Dict[str, Rule]) -> None:
         nullable_visitor.visit(rule)
 
 
+class GuardFirstSetVisitor(GrammarVisitor):
+    """Compute first sets that are safe to use to skip alternatives.
+
+    The visit methods return a (first set, nullable) pair. Unlike the first sets
+    of scripts/first_sets.py, an alternative that can run a cut, a forced item,
+    an action or a lookahead with an unknown first set without consuming any
+    token has an unknown first set.
+    """
+
+    def __init__(self, rules: Dict[str, Rule]) -> None:
+        self.rules = rules
+        self.first_sets: Dict[str, Tuple[FirstSet, bool]] = {
+            name: (frozenset(), False) for name in rules
+        }
+
+    def visit_Rhs(self, rhs: Rhs) -> Tuple[FirstSet, bool]:
+        first: Set[Tuple[str, str]] = set()
+        nullable = False
+        for alt in rhs.alts:
+            alt_first, alt_nullable = self.visit(alt)
+            if alt_first is None:
+                return None, True
+            first |= alt_first
+            nullable = nullable or alt_nullable
+        return frozenset(first), nullable
+
+    def visit_Alt(self, alt: Alt) -> Tuple[FirstSet, bool]:
+        first: Set[Tuple[str, str]] = set()
+        for item in alt.items:
+            item_first, item_nullable = self.visit(item)
+            if item_first is None:
+                return None, True
+            first |= item_first
+            if not item_nullable:
+                return frozenset(first), False
+        if alt.action:
+            return None, True
+        return frozenset(first), True
+
+    def visit_NamedItem(self, item: NamedItem) -> Tuple[FirstSet, bool]:
+        return self.visit(item.item)
+
+    def visit_PositiveLookahead(self, lookahead: Lookahead) -> Tuple[FirstSet, bool]:
+        first, _ = self.visit(lookahead.node)
+        return (None if first is None else frozenset()), True
+
+    def visit_NegativeLookahead(self, lookahead: Lookahead) -> Tuple[FirstSet, bool]:
+        return self.visit_PositiveLookahead(lookahead)
+
+    def visit_Forced(self, force: Forced) -> Tuple[FirstSet, bool]:
+        return None, True
+
+    def visit_Cut(self, cut: Cut) -> Tuple[FirstSet, bool]:
+        return None, True
+
+    def visit_Opt(self, opt: Opt) -> Tuple[FirstSet, bool]:
+        return self.visit(opt.node)[0], True
+
+    def visit_Repeat0(self, repeat: Repeat0) -> Tuple[FirstSet, bool]:
+        return self.visit(repeat.node)[0], True
+
+    def visit_Repeat1(self, repeat: Repeat1) -> Tuple[FirstSet, bool]:
+        return self.visit(repeat.node)
+
+    def visit_Gather(self, gather: Gather) -> Tuple[FirstSet, bool]:
+        return self.visit(gather.node)
+
+    def visit_Group(self, group: Group) -> Tuple[FirstSet, bool]:
+        return self.visit(group.rhs)
+
+    def visit_NameLeaf(self, node: NameLeaf) -> Tuple[FirstSet, bool]:
+        name = node.value
+        if name in self.first_sets:
+            return self.first_sets[name]
+        if name in ("NAME", "SOFT_KEYWORD"):
+            return frozenset({("type", "NAME")}), False
+        if name in ("NUMBER", "STRING", "OP", "TYPE_COMMENT"):
+            return frozenset({("type", name)}), False
+        if name in ("FSTRING_START", "FSTRING_MIDDLE", "FSTRING_END"):
+            # These tokens never match when the tokenizer does not produce them.
+            return frozenset({("type", name)} if hasattr(token, name) else ()), False
+        if name in ("NEWLINE", "DEDENT", "INDENT", "ENDMARKER"):
+            # Parser.expect also matches the name of the token as a string.
+            return frozenset({("type", name), ("string", name)}), False
+        return None, True
+
+    def visit_StringLeaf(self, node: StringLeaf) -> Tuple[FirstSet, bool]:
+        val = ast.literal_eval(node.value)
+        if val in exact_token_types:
+            type_name = token.tok_name[exact_token_types[val]]
+            return frozenset({("string", val), ("type", type_name)}), False
+        if not val or val in token.__dict__:
+            return None, True
+        return frozenset({("string", val)}), False
+
+
+def compute_guard_first_sets(rules: Dict[str, Rule]) -> GuardFirstSetVisitor:
+    """Compute the first sets of all the rules, see GuardFirstSetVisitor."""
+    visitor = GuardFirstSetVisitor(rules)
+    changed = True
+    while changed:
+        changed = False
+        for name, rule in rules.items():
+            result = visitor.visit(rule.rhs)
+            if result != visitor.first_sets[name]:
+                visitor.first_sets[name] = result
+                changed = True
+    return visitor
+
+
 def compute_left_recursives(
     rules: Dict[str, Rule]
 ) -> Tuple[Dict[str, AbstractSet[str]], List[AbstractSet[str]]]:
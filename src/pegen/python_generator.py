@@ -1,7 +1,9 @@
 import ast
+import contextlib
+import io
 import re
 import token
-from typing import IO, Any, Dict, List, Optional, Sequence, Set, Text, Tuple
+from typing import IO, Any, Dict, FrozenSet, Iterator, List, Optional, Set, Text, Tuple
 
 from pegen import grammar
 from pegen.grammar import (
@@ -23,7 +25,14 @@ from pegen.grammar import (
     Rule,
     StringLeaf,
 )
-from pegen.parser_generator import ParserGenerator
+from pegen.memo_profile import MemoProfile
+from pegen.parser_generator import (
+    FirstSet,
+    GuardFirstSetVisitor,
+    ParserGenerator,
+    compute_guard_first_sets,
+)
+from pegen.tokenizer import exact_token_types
 
 MODULE_PREFIX = """\
 #!/usr/bin/env python3.8
@@ -38,6 +47,39 @@ from typing import Any, Optional
 from pegen.parser import memoize, memoize_left_rec, logger, Parser
 
 """
+# all: memoize every rule, flagged: only rules marked with (memo),
+# auto: rules marked with (memo) and rules that may be re-entered at the same position,
+# profile: rules whose cache hit rate in a MemoProfile is high enough.
+MEMO_MODES = ("all", "flagged", "auto", "profile")
+
+# Minimum number of guarded alternatives of a rule using a dispatch table.
+DISPATCH_MIN_ALTS = 4
+
+# Token names matched on their type alone when specializing literals.
+TYPE_TOKENS = ("NEWLINE", "DEDENT", "INDENT", "ENDMARKER")
+
+# Methods called over and over by the generated rules, and the locals they are
+# bound to by the rules calling them more than once with local_aliases.
+LOCAL_ALIASES = {
+    "self._mark": "_mark",
+    "self._reset": "_reset",
+    "self.expect": "_expect",
+    "self.expect_string": "_expect_string",
+    "self.expect_operator": "_expect_operator",
+    "self.expect_type": "_expect_type",
+    "self.expect_name": "_expect_name",
+    "self.expect_soft_keyword": "_expect_soft_keyword",
+    "self.positive_lookahead": "_positive_lookahead",
+    "self.negative_lookahead": "_negative_lookahead",
+    "self._tokenizer.peek": "_peek",
+    "self._tokenizer.get_start": "_get_start",
+    "self._tokenizer.get_last_non_whitespace_token": "_get_last_non_whitespace_token",
+}
+# The methods are called, or passed to the lookahead helpers.
+LOCAL_ALIAS_RE = re.compile(
+    r"\b(%s)(?=[(,])" % "|".join(re.escape(name) for name in LOCAL_ALIASES)
+)
+
 MODULE_SUFFIX = """
 
 if __name__ == '__main__':
@@ -92,7 +134,7 @@ class InvalidNodeVisitor(GrammarVisitor):
 
 
 class PythonCallMakerVisitor(GrammarVisitor):
-    def __init__(self, parser_generator: ParserGenerator):
+    def __init__(self, parser_generator: "PythonParserGenerator"):
         self.gen = parser_generator
         self.cache: Dict[Any, Any] = {}
         self.keywords: Set[str] = set()
@@ -101,6 +143,8 @@ class PythonCallMakerVisitor(GrammarVisitor):
     def visit_NameLeaf(self, node: NameLeaf) -> Tuple[Optional[str], str]:
         name = node.value
         if name == "SOFT_KEYWORD":
+            if self.gen.specialize_terminals:
+                return "soft_keyword", "self.expect_soft_keyword()"
             return "soft_keyword", "self.soft_keyword()"
         if name in (
             "NAME",
@@ -112,10 +156,18 @@ class PythonCallMakerVisitor(GrammarVisitor):
             "OP",
             "TYPE_COMMENT",
         ):
+            if self.gen.specialize_terminals:
+                if name == "NAME":
+                    return "name", "self.expect_name()"
+                # The f-string tokens only exist in Python 3.12+.
+                if hasattr(token, name):
+                    return name.lower(), f"self.expect_type(tokenize.{name})"
             name = name.lower()
             return name, f"self.{name}()"
         if name in ("NEWLINE", "DEDENT", "INDENT", "ENDMARKER", "ASYNC", "AWAIT"):
             # Avoid using names that can be Python keywords
+            if self.gen.specialize_literals and name in TYPE_TOKENS:
+                return "_" + name.lower(), f"self.expect_type(tokenize.{name})"
             return "_" + name.lower(), f"self.expect({name!r})"
         return name, f"self.{name}()"
 
@@ -126,7 +178,94 @@ class PythonCallMakerVisitor(GrammarVisitor):
                 self.keywords.add(val)
             else:
                 self.soft_keywords.add(val)
-        return "literal", f"self.expect({node.value})"
+        return "literal", self.expect_call(node.value)
+
+    def expect_call(self, literal: str) -> str:
+        """Return the call matching a quoted literal of the grammar."""
+        val = ast.literal_eval(literal)
+        if not self.gen.specialize_literals:
+            return f"self.expect({literal})"
+        if val in exact_token_types:
+            type_name = token.tok_name[exact_token_types[val]]
+            return f"self.expect_operator({literal}, tokenize.{type_name})"
+        if val in token.__dict__:
+            # Literals spelling a token name also match tokens of that type.
+            return f"self.expect({literal})"
+        return f"self.expect_string({literal})"
+
+    def literal_tests(self, literal: str) -> List[str]:
+        """Return the tests of the next token (_next_tok) done by expect_call(literal)."""
+        val = ast.literal_eval(literal)
+        tests = [f"_next_tok.string == {literal}"]
+        if val in exact_token_types:
+            tests.append(f"_next_tok.type == tokenize.{token.tok_name[exact_token_types[val]]}")
+            return tests
+        if self.gen.specialize_literals and val not in token.__dict__:
+            return tests
+        if isinstance(getattr(token, val, None), int):
+            tests.append(f"_next_tok.type == tokenize.{val}")
+        return tests
+
+    def token_tests(self, node: Any) -> Optional[List[str]]:
+        """Return the tests of the next token (_next_tok) equivalent to matching node.
+
+        Any of the tests may succeed. None is returned when node is not a token,
+        or a group of tokens, as matching it then calls a rule.
+        """
+        if isinstance(node, StringLeaf):
+            return self.literal_tests(node.value)
+        if isinstance(node, NameLeaf):
+            name = node.value
+            if name == "SOFT_KEYWORD":
+                return [
+                    "_next_tok.type == tokenize.NAME and _next_tok.string in self._soft_keywords"
+                ]
+            if name == "NAME":
+                return [
+                    "_next_tok.type == tokenize.NAME and _next_tok.string not in self._keywords"
+                ]
+            if name in (
+                "NUMBER",
+                "STRING",
+                "FSTRING_START",
+                "FSTRING_MIDDLE",
+                "FSTRING_END",
+                "OP",
+                "TYPE_COMMENT",
+            ):
+                # The f-string tokens only exist in Python 3.12+.
+                return [f"_next_tok.type == tokenize.{name}"] if hasattr(token, name) else None
+            if name in ("NEWLINE", "DEDENT", "INDENT", "ENDMARKER", "ASYNC", "AWAIT"):
+                if self.gen.specialize_literals and name in TYPE_TOKENS:
+                    return [f"_next_tok.type == tokenize.{name}"]
+                return self.literal_tests(repr(name))
+            return None
+        if isinstance(node, Group):
+            return self.token_tests(node.rhs)
+        if isinstance(node, Rhs):
+            tests: List[str] = []
+            for alt in node.alts:
+                # An action could make the alternative fail.
+                if len(alt.items) != 1 or alt.action:
+                    return None
+                alt_tests = self.token_tests(alt.items[0].item)
+                if alt_tests is None:
+                    return None
+                tests.extend(alt_tests)
+            return tests
+        return None
+
+    def inline_lookahead(self, node: Lookahead) -> Optional[str]:
+        """Return a test of the next token matching the operand of a lookahead, if possible."""
+        tests = self.token_tests(node.node)
+        if tests is None:
+            return None
+        if len(tests) > 1:
+            tests = [f"({test})" if " and " in test else test for test in tests]
+        check = " or ".join(tests)
+        if check.count("_next_tok") == 1:
+            return check.replace("_next_tok", "self._tokenizer.peek()")
+        return check.replace("_next_tok", "(_next_tok := self._tokenizer.peek())", 1)
 
     def visit_Rhs(self, node: Rhs) -> Tuple[Optional[str], str]:
         if node in self.cache:
@@ -152,10 +291,16 @@ class PythonCallMakerVisitor(GrammarVisitor):
         return head, tail
 
     def visit_PositiveLookahead(self, node: PositiveLookahead) -> Tuple[None, str]:
+        check = self.inline_lookahead(node) if self.gen.inline_lookaheads else None
+        if check is not None:
+            return None, check
         head, tail = self.lookahead_call_helper(node)
         return None, f"self.positive_lookahead({head}, {tail})"
 
     def visit_NegativeLookahead(self, node: NegativeLookahead) -> Tuple[None, str]:
+        check = self.inline_lookahead(node) if self.gen.inline_lookaheads else None
+        if check is not None:
+            return None, f"not ({check})"
         head, tail = self.lookahead_call_helper(node)
         return None, f"self.negative_lookahead({head}, {tail})"
 
@@ -203,7 +348,7 @@ class PythonCallMakerVisitor(GrammarVisitor):
         else:
             return (
                 "forced",
-                f"self.expect_forced(self.expect({node.node.value}), {node.node.value!r})",
+                f"self.expect_forced({self.expect_call(node.node.value)}, {node.node.value!r})",
             )
 
 
@@ -223,6 +368,78 @@ class UsedNamesVisitor(ast.NodeVisitor):
         return {node.id}
 
 
+# Methods of the Python grammar checking the items of an alternative, which
+# the recognizers still call, as well as the raise_syntax_error methods. The
+# strings are only checked by generate_ast_for_string before Python 3.12.
+CHECKING_METHODS = frozenset(
+    [
+        "check_fstring_conversion",
+        "check_version",
+        "ensure_imaginary",
+        "ensure_real",
+        "generate_ast_for_string",
+    ]
+)
+
+
+class CheckingCallsVisitor(ast.NodeVisitor):
+    """Find the calls of an action that raise syntax errors or check its items.
+
+    Every call is returned as source text. The node given to check_version
+    is replaced with True, and the calls in the branches of a conditional
+    expression stay in a conditional expression.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+
+    def generic_visit(self, node: ast.AST) -> List[str]:
+        result = []
+        for child in ast.iter_child_nodes(node):
+            result.extend(self.visit(child))
+        return result
+
+    def visit_Call(self, node: ast.Call) -> List[str]:
+        func = node.func
+        if not (
+            isinstance(func, ast.Attribute)
+            and isinstance(func.value, ast.Name)
+            and func.value.id == "self"
+            and (func.attr in CHECKING_METHODS or func.attr.startswith("raise_syntax_error"))
+        ):
+            return self.generic_visit(node)
+        if func.attr == "check_version" and len(node.args) == 3 and not node.keywords:
+            version, message = (self.segment(arg) for arg in node.args[:2])
+            return [
+                *self.visit(node.args[2]),
+                f"self.check_version({version}, {message}, True)",
+            ]
+        return [self.segment(node)]
+
+    def visit_IfExp(self, node: ast.IfExp) -> List[str]:
+        body = self.join(self.visit(node.body))
+        orelse = self.join(self.visit(node.orelse))
+        if body is None and orelse is None:
+            return self.visit(node.test)
+        return [
+            *self.visit(node.test),
+            f"({body or 'True'} if {self.segment(node.test)} else {orelse or 'True'})",
+        ]
+
+    def segment(self, node: ast.AST) -> str:
+        text = ast.get_source_segment(self.source, node)
+        assert text is not None
+        return text
+
+    @staticmethod
+    def join(calls: List[str]) -> Optional[str]:
+        if not calls:
+            return None
+        if len(calls) == 1:
+            return calls[0]
+        return f"({', '.join(calls)})[-1]"
+
+
 class PythonParserGenerator(ParserGenerator, GrammarVisitor):
     def __init__(
         self,
@@ -231,6 +448,19 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
         tokens: Set[str] = set(token.tok_name.values()),
         location_formatting: Optional[str] = None,
         unreachable_formatting: Optional[str] = None,
+        *,
+        inline_memo: bool = False,
+        memo_mode: str = "all",
+        memo_profile: Optional[MemoProfile] = None,
+        min_hit_rate: float = 0.1,
+        specialize_literals: bool = False,
+        specialize_terminals: bool = False,
+        first_set_guards: bool = False,
+        dispatch_tables: bool = False,
+        skip_actions: bool = False,
+        local_aliases: bool = False,
+        inline_lookaheads: bool = False,
+        loop_left_recursion: bool = False,
     ):
         tokens.add("SOFT_KEYWORD")
         tokens.update(
@@ -247,6 +477,95 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
             "end_lineno=end_lineno, end_col_offset=end_col_offset"
         )
         self.cleanup_statements: List[str] = []
+        # Emit the memoization of non left-recursive rules in the rule bodies
+        # rather than through the memoize decorator (which supports verbose mode).
+        self.inline_memo = inline_memo
+        self._memo_in_body = False
+        self._inline_memo_rules: List[str] = []
+        if memo_mode not in MEMO_MODES:
+            raise ValueError(
+                f"Unknown memoization mode {memo_mode!r}, expected one of {MEMO_MODES}"
+            )
+        if memo_mode == "profile" and memo_profile is None:
+            raise ValueError("The profile memoization mode requires a memo profile")
+        self.memo_mode = memo_mode
+        self.memo_profile = memo_profile
+        self.min_hit_rate = min_hit_rate
+        self._reentered_rules: Set[str] = set()
+        # Match the literals of the grammar with the unmemoized expect_string,
+        # expect_operator and expect_type methods rather than with expect.
+        self.specialize_literals = specialize_literals
+        # Match NAME, NUMBER, STRING, OP... with the unmemoized expect_name,
+        # expect_soft_keyword and expect_type methods.
+        self.specialize_terminals = specialize_terminals
+        # Skip the alternatives that cannot start with the next token.
+        self.first_set_guards = first_set_guards
+        self._first_set_visitor: Optional[GuardFirstSetVisitor] = None
+        self._alt_guards: Dict[int, str] = {}
+        self._guard_token_fetched = False
+        # Select the alternatives of rules with many guarded alternatives with a
+        # table mapping token strings and types to bitmasks of alternatives.
+        self.dispatch_tables = dispatch_tables
+        self._dispatch_table: Optional[str] = None
+        self._dispatch_complete = False
+        # Generate a recognizer: rules return True rather than running the
+        # actions, and the alternatives calling invalid rules are left out.
+        self.skip_actions = skip_actions
+        # Bind the methods of LOCAL_ALIASES that a rule calls more than once to
+        # locals at the start of the rule, saving an attribute lookup per call.
+        self.local_aliases = local_aliases
+        self._alias_counts: Optional[Dict[str, int]] = None
+        # Test the next token in place of the lookaheads on tokens, rather than
+        # calling positive_lookahead or negative_lookahead.
+        self.inline_lookaheads = inline_lookaheads
+        # Grow the seed of directly left-recursive rules by only matching their
+        # left-recursive alternatives, split into a separate tail method.
+        self.loop_left_recursion = loop_left_recursion
+        self._left_rec_tail: Optional[str] = None
+
+    def print(self, *args: object) -> None:
+        if self._alias_counts is not None:
+            args = tuple(LOCAL_ALIAS_RE.sub(self._alias_placeholder, str(arg)) for arg in args)
+        super().print(*args)
+
+    def _alias_placeholder(self, match: "re.Match[str]") -> str:
+        assert self._alias_counts is not None
+        name = match.group(1)
+        self._alias_counts[name] = self._alias_counts.get(name, 0) + 1
+        return f"\0{name}\0"
+
+    @contextlib.contextmanager
+    def aliasing_locals(self) -> Iterator[None]:
+        """Bind the methods called more than once by the code printed inside to locals.
+
+        The code is printed to a buffer, with placeholders for the methods that
+        are replaced once it is known which ones are called more than once.
+        The tokens of the actions are separated by spaces, so they are left alone.
+        """
+        if not self.local_aliases:
+            yield
+            return
+        file = self.file
+        self.file = io.StringIO()
+        counts: Dict[str, int] = {}
+        self._alias_counts = counts
+        try:
+            yield
+            body = self.file.getvalue()
+        finally:
+            self.file = file
+            self._alias_counts = None
+        aliased = [name for name in LOCAL_ALIASES if counts.get(name, 0) > 1]
+        for name in aliased:
+            self.print(f"{LOCAL_ALIASES[name]} = {name}")
+        assert self.file is not None
+        self.file.write(
+            re.sub(
+                "\0([^\0]*)\0",
+                lambda match: LOCAL_ALIASES[match[1]] if match[1] in aliased else match[1],
+                body,
+            )
+        )
 
     def generate(self, filename: str) -> None:
         header = self.grammar.metas.get("header", MODULE_PREFIX)
@@ -255,12 +574,31 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
         subheader = self.grammar.metas.get("subheader", "")
         if subheader:
             self.print(subheader)
+        uses_tokenize = (
+            self.specialize_literals
+            or self.specialize_terminals
+            or self.first_set_guards
+            or self.dispatch_tables
+            or self.inline_lookaheads
+        )
+        if uses_tokenize and not re.search(r"^import tokenize$", f"{header}\n{subheader}", re.M):
+            # Token types are referred to as attributes of the tokenize module.
+            self.print("import tokenize")
         cls_name = self.grammar.metas.get("class", "GeneratedParser")
+        if self.memo_mode == "auto":
+            self.collect_todo()
+            self._reentered_rules = self.find_reentered_rules()
+        if self.first_set_guards or self.dispatch_tables:
+            self.collect_todo()
+            self._first_set_visitor = compute_guard_first_sets(self.all_rules)
         self.print("# Keywords and soft keywords are listed at the end of the parser definition.")
         self.print(f"class {cls_name}(Parser):")
         while self.todo:
             for rulename, rule in list(self.todo.items()):
                 del self.todo[rulename]
+                if self.skip_actions and rulename.startswith("invalid_"):
+                    continue
+                self.all_rules[rulename] = rule
                 self.print()
                 with self.indent():
                     self.visit(rule)
@@ -269,64 +607,241 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
         with self.indent():
             self.print(f"KEYWORDS = {tuple(sorted(self.callmakervisitor.keywords))}")
             self.print(f"SOFT_KEYWORDS = {tuple(sorted(self.callmakervisitor.soft_keywords))}")
+            if self._inline_memo_rules:
+                self.print(f"INLINE_MEMO_RULES = {tuple(self._inline_memo_rules)}")
+            if any(name.startswith("invalid_") for name in self.rules):
+                sensitive = (
+                    [] if self.skip_actions else sorted(self.find_invalid_sensitive_rules())
+                )
+                self.print(f"INVALID_SENSITIVE_RULES = frozenset({sensitive})")
 
         trailer = self.grammar.metas.get("trailer", MODULE_SUFFIX.format(class_name=cls_name))
         if trailer is not None:
             self.print(trailer.rstrip("\n"))
 
-    def alts_uses_locations(self, alts: Sequence[Alt]) -> bool:
-        for alt in alts:
-            if alt.action and "LOCATIONS" in alt.action:
-                return True
-            for n in alt.items:
-                if isinstance(n.item, Group) and self.alts_uses_locations(n.item.rhs.alts):
-                    return True
-        return False
+    def find_callees(self, rule: Rule) -> List[str]:
+        """Return the rules called by the code of a rule, once per call site."""
+        callees = []
+        for alt in rule.flatten().alts:
+            for item in alt.items:
+                _, call = self.callmakervisitor.visit(item.item)
+                for callee in re.findall(r"self\.(\w+)", call):
+                    if callee in self.all_rules:
+                        callees.append(callee)
+        return callees
+
+    def find_reentered_rules(self) -> Set[str]:
+        """Find the rules that may be invoked more than once at the same position.
+
+        A rule invoked from a single call site is only re-entered if its caller
+        is, and memoized rules are never re-entered. Left-recursive rules
+        re-evaluate their body at the same position while growing the seed.
+        """
+        call_sites: Dict[str, List[str]] = {name: [] for name in self.all_rules}
+        for name, rule in self.all_rules.items():
+            for callee in self.find_callees(rule):
+                call_sites[callee].append(name)
+        return {
+            name
+            for name, callers in call_sites.items()
+            if len(callers) > 1 or (callers and self.all_rules[callers[0]].left_recursive)
+        }
+
+    def find_invalid_sensitive_rules(self) -> Set[str]:
+        """Find the rules that can reach an invalid rule.
+
+        Only their memoized results may change when invalid rules are called.
+        """
+        callers: Dict[str, Set[str]] = {name: set() for name in self.all_rules}
+        for name, rule in self.all_rules.items():
+            for callee in self.find_callees(rule):
+                callers[callee].add(name)
+        todo = [name for name in self.all_rules if name.startswith("invalid_")]
+        sensitive = set(todo)
+        while todo:
+            for caller in callers[todo.pop()] - sensitive:
+                sensitive.add(caller)
+                todo.append(caller)
+        return sensitive
+
+    def rule_is_memoized(self, rule: Rule) -> bool:
+        if self.memo_mode == "flagged":
+            return rule.memo
+        if self.memo_mode == "auto":
+            return rule.memo or rule.name in self._reentered_rules
+        if self.memo_mode == "profile":
+            assert self.memo_profile is not None
+            hit_rate = self.memo_profile.hit_rate(rule.name)
+            return hit_rate is not None and hit_rate >= self.min_hit_rate
+        return True
+
+    def split_left_recursive_alts(self, rule: Rule) -> Optional[Tuple[List[Alt], List[Alt]]]:
+        """Split the alternatives of a directly left-recursive rule.
+
+        Return the alternatives starting with the rule itself and the other
+        ones, or None if the rule is not only left-recursive through the
+        former or if some of the latter come first.
+        """
+        if not rule.left_recursive or {rule.name} not in self.first_sccs:
+            return None
+        recursive: List[Alt] = []
+        others: List[Alt] = []
+        for alt in rule.flatten().alts:
+            first = alt.items[0].item
+            if isinstance(first, NameLeaf) and first.value == rule.name:
+                if others:
+                    return None
+                recursive.append(alt)
+            elif rule.name in alt.initial_names():
+                return None
+            else:
+                others.append(alt)
+        if not recursive or not others:
+            return None
+        return recursive, others
+
+    def alt_first_set(self, alt: Alt) -> FirstSet:
+        """Return the tokens alt can start with, or None if it must always be tried."""
+        assert self._first_set_visitor is not None
+        first: FirstSet
+        first, nullable = self._first_set_visitor.visit(alt)
+        if not first or nullable:
+            return None
+        return first
+
+    def token_guard(self, first: FrozenSet[Tuple[str, str]]) -> str:
+        """Return a test of the next token (_tok) failing when it is not in first."""
+        strings = sorted(value for kind, value in first if kind == "string")
+        types = [f"tokenize.{value}" for kind, value in sorted(first) if kind == "type"]
+        tests = []
+        if len(strings) == 1:
+            tests.append(f"_tok.string == {strings[0]!r}")
+        elif strings:
+            tests.append(f"_tok.string in {{{', '.join(map(repr, strings))}}}")
+        if len(types) == 1:
+            tests.append(f"_tok.type == {types[0]}")
+        elif types:
+            tests.append(f"_tok.type in ({', '.join(types)})")
+        return " or ".join(tests)
+
+    def print_dispatch_table(
+        self, rulename: str, guarded: List[Tuple[Alt, FrozenSet[Tuple[str, str]]]]
+    ) -> None:
+        table: Dict[Tuple[str, str], int] = {}
+        for index, (alt, first) in enumerate(guarded):
+            self._alt_guards[id(alt)] = f"_alts & {1 << index}"
+            for key in first:
+                table[key] = table.get(key, 0) | 1 << index
+        entries = [
+            f"{value!r}: {bits}" if kind == "string" else f"tokenize.{value}: {bits}"
+            for (kind, value), bits in sorted(table.items())
+        ]
+        self._dispatch_table = f"_{rulename}_dispatch"
+        self.print(f"{self._dispatch_table} = {{{', '.join(entries)}}}")
 
     def add_return(self, ret_val: str) -> None:
         for stmt in self.cleanup_statements:
             self.print(stmt)
+        if self._memo_in_body:
+            if ret_val != "None":
+                self.print(f"_res = {ret_val}")
+                ret_val = "_res"
+            self.print(f"_cache[_key] = {ret_val}, self._mark()")
         self.print(f"return {ret_val};")
 
     def visit_Rule(self, node: Rule) -> None:
+        split = self.split_left_recursive_alts(node) if self.loop_left_recursion else None
+        if split:
+            recursive, others = split
+            base = Rule(node.name, node.type, Rhs(others))
+            tail = Rule(f"_{node.name}_tail", node.type, Rhs(recursive))
+            # The tail is not memoized since it is called with the seed growing.
+            base.left_recursive = base.leader = tail.left_recursive = True
+            base.nullable = node.nullable
+            self._left_rec_tail = tail.name
+            self.visit(base)
+            self._left_rec_tail = None
+            self.print()
+            self.visit(tail)
+            return
         is_loop = node.is_loop()
         is_gather = node.is_gather()
         rhs = node.flatten()
+        self._memo_in_body = False
+        self._alt_guards = {}
+        self._guard_token_fetched = False
+        self._dispatch_table = None
+        self._dispatch_complete = False
+        if self._first_set_visitor is not None and not is_loop:
+            first_sets = [(alt, self.alt_first_set(alt)) for alt in rhs.alts]
+            guarded = [(alt, first) for alt, first in first_sets if first]
+            if self.dispatch_tables and len(guarded) >= DISPATCH_MIN_ALTS:
+                self.print_dispatch_table(node.name, guarded)
+                self._dispatch_complete = len(guarded) == len(rhs.alts)
+            elif self.first_set_guards:
+                for alt, first in guarded:
+                    self._alt_guards[id(alt)] = self.token_guard(first)
         if node.left_recursive:
-            if node.leader:
+            if self._left_rec_tail:
+                self.print(f"@memoize_left_rec(tail={self._left_rec_tail!r})")
+            elif node.leader:
                 self.print("@memoize_left_rec")
             else:
                 # Non-leader rules in a cycle are not memoized,
                 # but they must still be logged.
                 self.print("@logger")
+        elif not self.rule_is_memoized(node):
+            # Keep the rule visible in verbose mode unless memoization is inlined.
+            if not self.inline_memo:
+                self.print("@logger")
+        elif self.inline_memo:
+            self._memo_in_body = True
+            self._inline_memo_rules.append(node.name)
         else:
             self.print("@memoize")
-        node_type = node.type or "Any"
+        node_type = "Any" if self.skip_actions else node.type or "Any"
         self.print(f"def {node.name}(self) -> Optional[{node_type}]:")
         with self.indent():
             self.print(f"# {node.name}: {rhs}")
             if node.nullable:
                 self.print(f"# nullable={node.nullable}")
 
+            if self._memo_in_body:
+                # Look up the cache before touching any parser state.
+                self.print("mark = self._mark()")
+                self.print("if self.packed_memo:")
+                with self.indent():
+                    self.print("_cache = self._cache.row(mark)")
+                    self.print(f"_key = self._slot_{node.name}")
+                self.print("else:")
+                with self.indent():
+                    self.print("_cache = self._cache")
+                    self.print(f"_key = mark, {node.name!r}, ()")
+                self.print("_memo = _cache.get(_key)")
+                self.print("if _memo is not None:")
+                with self.indent():
+                    self.print("self._reset(_memo[1])")
+                    self.print("return _memo[0]")
+
             if node.name.endswith("without_invalid"):
                 self.print("_prev_call_invalid = self.call_invalid_rules")
                 self.print("self.call_invalid_rules = False")
                 self.cleanup_statements.append("self.call_invalid_rules = _prev_call_invalid")
 
-            self.print("mark = self._mark()")
-            if self.alts_uses_locations(node.rhs.alts):
-                self.print("tok = self._tokenizer.peek()")
-                self.print("start_lineno, start_col_offset = tok.start")
-            if is_loop:
-                self.print("children = []")
-            self.visit(rhs, is_loop=is_loop, is_gather=is_gather)
-            if is_loop:
-                self.add_return("children")
-            else:
-                self.add_return("None")
+            with self.aliasing_locals():
+                if not self._memo_in_body:
+                    self.print("mark = self._mark()")
+                if is_loop:
+                    self.print("children = []")
+                self.visit(rhs, is_loop=is_loop, is_gather=is_gather)
+                if is_loop:
+                    self.add_return("children")
+                else:
+                    self.add_return("None")
 
         if node.name.endswith("without_invalid"):
             self.cleanup_statements.pop()
+        self._memo_in_body = False
 
     def visit_NamedItem(
         self, node: NamedItem, used: Optional[Set[str]], unreachable: bool
@@ -352,6 +867,8 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
         if is_loop:
             assert len(node.alts) == 1
         for alt in node.alts:
+            if self.skip_actions and self.invalidvisitor.visit(alt):
+                continue
             self.visit(alt, is_loop=is_loop, is_gather=is_gather)
 
     def print_action(
@@ -377,6 +894,8 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
                     action = f"[{', '.join(self.local_variable_names)}]"
 
         if locations:
+            # The locations are only looked up once the alternative succeeded.
+            self.print("start_lineno, start_col_offset = self._tokenizer.get_start(mark)")
             self.print("tok = self._tokenizer.get_last_non_whitespace_token()")
             self.print("end_lineno, end_col_offset = tok.end")
 
@@ -386,11 +905,37 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
         else:
             self.add_return(f"{action}")
 
+    @staticmethod
+    def recognizer_action(action: Optional[str]) -> str:
+        if not action:
+            return "True"
+        if action.strip() == "None":
+            # Actions only returning None make their alternative fail.
+            return "None"
+        if not re.search(
+            r"\bself\s*\.\s*(raise_syntax_error|check_|ensure_|generate_ast)", action
+        ):
+            return "True"
+        # The magic name is not an expression, the keyword argument syntax
+        # keeps the action parseable.
+        source = action.replace("LOCATIONS", "**LOCATIONS")
+        calls = CheckingCallsVisitor(source).visit(ast.parse(source, mode="eval"))
+        checks = CheckingCallsVisitor.join(calls)
+        if checks is None:
+            return "True"
+        # The checks raise or return their result, which is never None but may
+        # be false, like the value of a real number.
+        return f"{checks.replace('**LOCATIONS', 'LOCATIONS')} is not None"
+
     def visit_Alt(self, node: Alt, is_loop: bool, is_gather: bool) -> None:
         has_cut = any(isinstance(item.item, Cut) for item in node.items)
         has_invalid = self.invalidvisitor.visit(node)
 
         action = node.action
+        # The alternatives of a single item without action still return it,
+        # so that the tokens reach the checks kept in the actions.
+        if self.skip_actions and (action or is_gather or len(node.items) != 1):
+            action = self.recognizer_action(action)
         if not action and not is_gather and has_invalid:
             action = "UNREACHABLE"
 
@@ -411,6 +956,20 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
             if has_cut:
                 used.add("cut")
 
+        guard = self._alt_guards.get(id(node))
+        if guard and not self._guard_token_fetched:
+            # All the alternatives are tried at the same position.
+            self.print("_tok = self._tokenizer.peek()")
+            if self._dispatch_table:
+                table = f"self.{self._dispatch_table}"
+                self.print(f"_alts = {table}.get(_tok.string, 0) | {table}.get(_tok.type, 0)")
+                if self._dispatch_complete:
+                    # No alternative can start with the next token.
+                    self.print("if not _alts:")
+                    with self.indent():
+                        self.add_return("None")
+            self._guard_token_fetched = True
+
         with self.local_variable_context():
             if has_cut:
                 self.print("cut = False")
@@ -423,6 +982,11 @@ class PythonParserGenerator(ParserGenerator, GrammarVisitor):
                 if has_invalid:
                     self.print("self.call_invalid_rules")
                     first = False
+                if guard:
+                    if not first:
+                        self.print("and")
+                    self.print(f"({guard})")
+                    first = False
                 for item in node.items:
                     if first:
                         first = False
@@ -1,29 +1,130 @@
+import io
+import itertools
+import sys
 import token
 import tokenize
-from typing import Dict, Iterator, List
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union, overload
 
 Mark = int  # NewType('Mark', int)
 
 exact_token_types = token.EXACT_TOKEN_TYPES
 
+_BRACKET_DEPTH = {"(": 1, "[": 1, "{": 1, ")": -1, "]": -1, "}": -1}
+
 
 def shorttok(tok: tokenize.TokenInfo) -> str:
     return "%-25.25s" % f"{tok.start[0]}.{tok.start[1]}: {token.tok_name[tok.type]}:{tok.string!r}"
 
 
+class CompactTokenBuffer:
+    """Memory efficient list of tokens.
+
+    Token types and positions are stored in parallel arrays, names and operators
+    are interned, and the source lines are stored once and shared by all the
+    tokens on them. TokenInfo objects are only created when a token is accessed.
+    """
+
+    def __init__(self) -> None:
+        self._types = array("B")
+        # Start line, start column, end line and end column of each token.
+        self._positions = array("l")
+        self._strings: List[str] = []
+        self._line_indexes = array("l")
+        self._lines: List[str] = []
+        self._last: Optional[tokenize.TokenInfo] = None
+        self._last_index = -1
+
+    def append(self, tok: tokenize.TokenInfo) -> None:
+        self._types.append(tok.type)
+        self._positions.extend(tok.start + tok.end)
+        string = tok.string
+        if tok.type in (token.NAME, token.OP):
+            string = sys.intern(string)
+        self._strings.append(string)
+        if not self._lines or self._lines[-1] != tok.line:
+            self._lines.append(tok.line)
+        self._line_indexes.append(len(self._lines) - 1)
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    @overload
+    def __getitem__(self, index: int) -> tokenize.TokenInfo:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[tokenize.TokenInfo]:
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[tokenize.TokenInfo, List[tokenize.TokenInfo]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self._types)
+        # The parser peeks at the same token many times in a row.
+        if index == self._last_index:
+            return self._last  # type: ignore
+        if not 0 <= index < len(self._types):
+            raise IndexError("token index out of range")
+        p = 4 * index
+        positions = self._positions
+        tok = tokenize.TokenInfo(
+            self._types[index],
+            self._strings[index],
+            (positions[p], positions[p + 1]),
+            (positions[p + 2], positions[p + 3]),
+            self._lines[self._line_indexes[index]],
+        )
+        self._last = tok
+        self._last_index = index
+        return tok
+
+    def __iter__(self) -> Iterator[tokenize.TokenInfo]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def get_line(self, lineno: int) -> str:
+        """Return the line of the first token starting on a line."""
+        positions = self._positions
+        low, high = 0, len(self._types)
+        while low < high:
+            middle = (low + high) // 2
+            if positions[4 * middle] < lineno:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(self._types) or positions[4 * low] != lineno:
+            raise KeyError(lineno)
+        return self._lines[self._line_indexes[low]]
+
+
 class Tokenizer:
     """Caching wrapper for the tokenize module.
 
     This is pretty tied to Python's syntax.
+
+    With compact=True tokens are stored in a CompactTokenBuffer, trading some
+    speed for a much smaller memory footprint on large sources.
     """
 
-    _tokens: List[tokenize.TokenInfo]
+    _tokens: Union[List[tokenize.TokenInfo], CompactTokenBuffer]
 
     def __init__(
-        self, tokengen: Iterator[tokenize.TokenInfo], *, path: str = "", verbose: bool = False
+        self,
+        tokengen: Iterator[tokenize.TokenInfo],
+        *,
+        path: str = "",
+        verbose: bool = False,
+        compact: bool = False,
     ):
         self._tokengen = tokengen
-        self._tokens = []
+        self._compact = compact
+        self._tokens = CompactTokenBuffer() if compact else []
+        # For each token, index of the last token up to it that is not whitespace.
+        self._last_non_whitespace = array("l")
         self._index = 0
         self._verbose = verbose
         self._lines: Dict[int, str] = {}
@@ -54,8 +155,16 @@ class Tokenizer:
                 and self._tokens[-1].type == token.NEWLINE
             ):
                 continue
+            if not self._tokens or (
+                tok.type != tokenize.ENDMARKER
+                and (tok.type < tokenize.NEWLINE or tok.type > tokenize.DEDENT)
+            ):
+                self._last_non_whitespace.append(len(self._tokens))
+            else:
+                self._last_non_whitespace.append(self._last_non_whitespace[-1])
             self._tokens.append(tok)
-            if not self._path and tok.start[0] not in self._lines:
+            # The compact buffer keeps the lines of the tokens itself.
+            if not self._path and not self._compact and tok.start[0] not in self._lines:
                 self._lines[tok.start[0]] = tok.line
         return self._tokens[self._index]
 
@@ -65,15 +174,24 @@ class Tokenizer:
         return self._tokens[-1]
 
     def get_last_non_whitespace_token(self) -> tokenize.TokenInfo:
-        for tok in reversed(self._tokens[: self._index]):
-            if tok.type != tokenize.ENDMARKER and (
-                tok.type < tokenize.NEWLINE or tok.type > tokenize.DEDENT
-            ):
-                break
-        return tok
+        """Return the last consumed token that is not whitespace.
+
+        The first token is returned if all consumed tokens are whitespace.
+        """
+        index = self._index
+        return self._tokens[self._last_non_whitespace[index - 1] if index else 0]
+
+    def get_start(self, index: Mark) -> Tuple[int, int]:
+        """Return the start of the token at a mark that is not past the current one."""
+        if index == len(self._tokens):
+            # Nothing was peeked at since the mark.
+            return self.peek().start
+        return self._tokens[index].start
 
     def get_lines(self, line_numbers: List[int]) -> List[str]:
         """Retrieve source lines corresponding to line numbers."""
+        if isinstance(self._tokens, CompactTokenBuffer) and not self._path:
+            return [self._tokens.get_line(n) for n in line_numbers]
         if self._lines:
             lines = self._lines
         else:
@@ -116,3 +234,158 @@ class Tokenizer:
         else:
             tok = self._tokens[self._index - 1]
             print(f"{fill} {shorttok(tok)}")
+
+
+def generate_tokens_from(
+    readline: Callable[[], str], line: int, indents: Sequence[str] = ()
+) -> Iterator[tokenize.TokenInfo]:
+    """Tokenize a source from one of its lines, like tokenize.generate_tokens.
+
+    readline returns the lines of the source from the given line on, which must
+    start a logical line outside of brackets and strings. indents are the
+    indentation strings (the strings of the INDENT tokens) of the blocks open at
+    that line, outermost first.
+    """
+    # Open the blocks with a line per indentation level, and drop their tokens.
+    prelude = [indent + "pass\n" for indent in indents]
+    lines = itertools.chain(prelude, iter(readline, ""))
+    shift = line - 1 - len(prelude)
+    for tok in tokenize.generate_tokens(lines.__next__):
+        if tok.start[0] <= len(prelude):
+            continue
+        if shift:
+            tok = tok._replace(
+                start=(tok.start[0] + shift, tok.start[1]), end=(tok.end[0] + shift, tok.end[1])
+            )
+        yield tok
+
+
+# Index of the first token, indentation and bracket depth of a line starting a
+# logical line, and whether an unterminated string was seen before it.
+_Boundary = Tuple[int, Tuple[str, ...], int, bool]
+
+
+def _scan_old_tokens(
+    tokens: Sequence[tokenize.TokenInfo], first_line: int, last_line: int
+) -> Tuple[int, int, Tuple[str, ...], Dict[int, _Boundary]]:
+    """Find where to resume tokenizing before an edit and where to stop after it.
+
+    Return the index of the first token to tokenize again, its line and the
+    indentation at that line, and the boundaries of the lines after the edit
+    that start a logical line, by line.
+    """
+    indents: List[str] = []
+    depth = 0
+    # tokenize keeps some state after an unterminated string continued on the
+    # next lines, the lines after it are never reused.
+    unterminated = False
+    resume = 0
+    resume_line = 1
+    resume_indents: Tuple[str, ...] = ()
+    # The depth may be negative since tokenize does not reject unbalanced
+    # closing brackets.
+    boundaries: Dict[int, _Boundary] = {}
+    for index, tok in enumerate(tokens):
+        if not index or tokens[index - 1].type == token.NEWLINE:
+            line = tokens[index - 1].end[0] + 1 if index else 1
+            if unterminated:
+                break
+            if line <= first_line:
+                if not depth:
+                    resume, resume_line, resume_indents = index, line, tuple(indents)
+            elif line > last_line:
+                boundaries[line] = index, tuple(indents), depth, False
+        if tok.type == token.INDENT:
+            indents.append(tok.string)
+        elif tok.type == token.DEDENT:
+            indents.pop()
+        elif tok.type == token.OP:
+            depth += _BRACKET_DEPTH.get(tok.string, 0)
+        elif tok.type == token.ERRORTOKEN and tok.start[0] != tok.end[0]:
+            unterminated = True
+    return resume, resume_line, resume_indents, boundaries
+
+
+def _tokenize_until_boundary(
+    tokens: Sequence[tokenize.TokenInfo],
+    source: str,
+    resume: int,
+    resume_line: int,
+    resume_indents: Tuple[str, ...],
+    boundaries: Dict[int, _Boundary],
+    line_delta: int,
+) -> List[tokenize.TokenInfo]:
+    """Tokenize a source from a line until the state matches one of the old boundaries.
+
+    The old tokens before resume and from the boundary on are reused.
+    """
+    readline = io.StringIO(source).readline
+    for _ in range(resume_line - 1):
+        readline()
+    tokenizer = Tokenizer(generate_tokens_from(readline, resume_line, resume_indents))
+    new_tokens = list(tokens[:resume])
+    indents = list(resume_indents)
+    depth = 0
+    unterminated = False
+    previous = new_tokens[-1] if new_tokens else None
+    while True:
+        tok = tokenizer.getnext()
+        if previous is not None and previous.type == token.NEWLINE:
+            if tok.type == token.NEWLINE:
+                # Dropped by the Tokenizer when tokenizing the whole source.
+                continue
+            boundary = boundaries.get(previous.end[0] + 1 - line_delta)
+            if boundary is not None and boundary[1:] == (tuple(indents), depth, unterminated):
+                new_tokens.extend(_shift_tokens(tokens[boundary[0] :], line_delta))
+                return new_tokens
+        new_tokens.append(tok)
+        if tok.type == token.ENDMARKER:
+            return new_tokens
+        if tok.type == token.INDENT:
+            indents.append(tok.string)
+        elif tok.type == token.DEDENT:
+            indents.pop()
+        elif tok.type == token.OP:
+            depth += _BRACKET_DEPTH.get(tok.string, 0)
+        elif tok.type == token.ERRORTOKEN and tok.start[0] != tok.end[0]:
+            unterminated = True
+        previous = tok
+
+
+def _shift_tokens(
+    tokens: Sequence[tokenize.TokenInfo], line_delta: int
+) -> Sequence[tokenize.TokenInfo]:
+    if not line_delta:
+        return tokens
+    return [
+        tok._replace(
+            start=(tok.start[0] + line_delta, tok.start[1]),
+            end=(tok.end[0] + line_delta, tok.end[1]),
+        )
+        for tok in tokens
+    ]
+
+
+def retokenize(
+    tokens: Sequence[tokenize.TokenInfo],
+    source: str,
+    first_line: int,
+    last_line: int,
+    line_delta: int,
+) -> List[tokenize.TokenInfo]:
+    """Tokenize a source after an edit, reusing the tokens of the source before it.
+
+    tokens are the tokens of the old source, as returned by a Tokenizer. The
+    edit replaced the lines first_line to last_line of the old source and added
+    line_delta lines. Tokenization resumes at the last line that starts a
+    logical line before the edit and stops at the first line after the edit
+    where the indentation and the nesting of brackets are the same in both
+    sources. The tokens before and after these lines are the old ones, shifted
+    by line_delta lines if needed.
+    """
+    resume, resume_line, resume_indents, boundaries = _scan_old_tokens(
+        tokens, first_line, last_line
+    )
+    return _tokenize_until_boundary(
+        tokens, source, resume, resume_line, resume_indents, boundaries, line_delta
+    )
@@ -2,9 +2,12 @@ import importlib.util
 import io
 import sys
 import textwrap
+import threading
 import tokenize
+from collections import OrderedDict
 from typing import IO, Any, Dict, Final, Optional, Type, cast
 
+from pegen.build import cache_key, cached_python_parser
 from pegen.grammar import Grammar
 from pegen.grammar_parser import GeneratedParser as GrammarParser
 from pegen.parser import Parser
@@ -27,11 +30,14 @@ def import_file(full_name: str, path: str) -> Any:
 
 
 def generate_parser(
-    grammar: Grammar, parser_path: Optional[str] = None, parser_name: str = "GeneratedParser"
+    grammar: Grammar,
+    parser_path: Optional[str] = None,
+    parser_name: str = "GeneratedParser",
+    **options: Any,
 ) -> Type[Parser]:
-    # Generate a parser.
+    # Generate a parser, options are passed to PythonParserGenerator.
     out = io.StringIO()
-    genr = PythonParserGenerator(grammar, out)
+    genr = PythonParserGenerator(grammar, out, **options)
     genr.generate("<string>")
 
     # Load the generated parser class.
@@ -66,10 +72,86 @@ def parse_string(
     return run_parser(file, parser_class, verbose=verbose)  # type: ignore # typeshed issue #3515
 
 
-def make_parser(source: str) -> Type[Parser]:
-    # Combine parse_string() and generate_parser().
-    grammar = parse_string(source, GrammarParser)
-    return generate_parser(grammar)
+class ParserClassCache:
+    """LRU cache of the parser classes made by make_parser, keyed by cache_key().
+
+    ``hits`` and ``misses`` count the lookups since the cache was created or
+    last cleared.
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._classes: "OrderedDict[str, Type[Parser]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._classes)
+
+    def get(self, key: str) -> Optional[Type[Parser]]:
+        with self._lock:
+            parser_class = self._classes.get(key)
+            if parser_class is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._classes.move_to_end(key)
+            return parser_class
+
+    def put(self, key: str, parser_class: Type[Parser]) -> None:
+        with self._lock:
+            self._classes[key] = parser_class
+            self._classes.move_to_end(key)
+            while len(self._classes) > self.maxsize:
+                self._classes.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._classes.clear()
+            self.hits = self.misses = 0
+
+
+def generated_parser_class(module: Any) -> Type[Parser]:
+    """Return the parser class of a module generated by pegen, whatever its @class."""
+    for value in vars(module).values():
+        # The classes defined in a @header have no keywords of their own.
+        if (
+            isinstance(value, type)
+            and issubclass(value, Parser)
+            and value.__module__ == module.__name__
+            and "KEYWORDS" in vars(value)
+        ):
+            return value
+    raise ValueError(f"{module.__name__} defines no generated parser")
+
+
+# Parser classes made by make_parser in this process.
+parser_cache = ParserClassCache()
+
+
+def make_parser(
+    source: str, *, cache_dir: Optional[str] = None, use_cache: bool = False, **options: Any
+) -> Type[Parser]:
+    # Combine parse_string() and generate_parser(). With use_cache, the classes
+    # made for the same grammar and options are shared, and with a cache
+    # directory the generated parsers are also kept on disk.
+    source = textwrap.dedent(source)
+    key = cache_key(source, **options) if use_cache else None
+    if key is not None:
+        parser_class = parser_cache.get(key)
+        if parser_class is not None:
+            return parser_class
+    if cache_dir is not None:
+        # The grammar is only parsed if the parser is not in the directory.
+        path = cached_python_parser(source, cache_dir=cache_dir, **options)
+        parser_class = generated_parser_class(import_file("py_parser", path))
+    else:
+        grammar = parse_string(source, GrammarParser, dedent=False)
+        parser_class = generate_parser(grammar, **options)
+    if key is not None:
+        parser_cache.put(key, parser_class)
+    return parser_class
 
 
 def print_memstats() -> bool:
@@ -52,7 +52,7 @@ def index() -> None:
         program_source = form.source.data
         output = io.StringIO()
         try:
-            parser_class = make_parser(grammar_source)
+            parser_class = make_parser(grammar_source, use_cache=True)
             result = parse_string(program_source, parser_class, verbose=False)
             print(result, file=output)
         except Exception:
@@ -3,35 +3,46 @@
 from pathlib import Path
 
 import pytest
-from pegen.build import build_parser
-from pegen.utils import generate_parser
+from pegen.build import build_cached_python_parser
+from pegen.utils import import_file
 
 
 @pytest.fixture(scope="session")
-def python_parser_cls():
+def parser_cache_dir(request, tmp_path_factory):
+    # The cache plugin may be disabled with -p no:cacheprovider.
+    if getattr(request.config, "cache", None) is None:
+        return tmp_path_factory.mktemp("pegen")
+    return request.config.cache.mkdir("pegen")
+
+
+@pytest.fixture(scope="session")
+def python_parser_module(parser_cache_dir):
     grammar_path = Path(__file__).parent.parent.parent / "data/python.gram"
-    grammar = build_parser(grammar_path)[0]
     source_path = str(Path(__file__).parent / "parser_cache" / "py_parser.py")
-    parser_cls = generate_parser(grammar, source_path, "PythonParser")
-
-    return parser_cls
+    # The parser is only generated again when the grammar or pegen changed.
+    build_cached_python_parser(str(grammar_path), source_path, str(parser_cache_dir))
+    return import_file("py_parser", source_path)
 
 
 @pytest.fixture(scope="session")
-def python_parse_file():
+def python_recognizer_module(parser_cache_dir):
     grammar_path = Path(__file__).parent.parent.parent / "data/python.gram"
-    grammar = build_parser(grammar_path)[0]
-    source_path = str(Path(__file__).parent / "parser_cache" / "py_parser.py")
-    parser_cls = generate_parser(grammar, source_path, "parse_file")
+    path = build_cached_python_parser(
+        str(grammar_path), None, str(parser_cache_dir), skip_actions=True
+    )
+    return import_file("py_recognizer", path)
 
-    return parser_cls
+
+@pytest.fixture(scope="session")
+def python_parser_cls(python_parser_module):
+    return python_parser_module.PythonParser
 
 
 @pytest.fixture(scope="session")
-def python_parse_str():
-    grammar_path = Path(__file__).parent.parent.parent / "data/python.gram"
-    grammar = build_parser(grammar_path)[0]
-    source_path = str(Path(__file__).parent / "parser_cache" / "py_parser.py")
-    parser_cls = generate_parser(grammar, source_path, "parse_string")
+def python_parse_file(python_parser_module):
+    return python_parser_module.parse_file
 
-    return parser_cls
+
+@pytest.fixture(scope="session")
+def python_parse_str(python_parser_module):
+    return python_parser_module.parse_string
@@ -0,0 +1,63 @@
+"""Test that incremental parsing gives the same results as a new parse."""
+
+import ast
+import textwrap
+
+import pytest
+from pegen.incremental import IncrementalParser
+
+SOURCE = textwrap.dedent(
+    """\
+    import sys
+
+    def f(a, b=1):
+        if a:
+            return a + b
+        else:
+            return [b for b in range(a)]
+
+    class A:
+        x = f(1)
+
+        def g(self):
+            return self.x
+    """
+)
+
+
+def parse_or_error(parse):
+    try:
+        return ast.dump(parse(), include_attributes=True)
+    except SyntaxError as e:
+        return e.msg, e.lineno, e.offset
+
+
+@pytest.mark.parametrize(
+    "start, end, text",
+    [
+        ((5, 19), (5, 20), "c"),
+        ((5, 19), (5, 20), "c * 2"),
+        ((10, 10), (10, 10), ", 2"),
+        ((4, 0), (4, 0), "    a += 1\n"),
+        ((6, 4), (8, 0), ""),
+        ((10, 8), (10, 9), "("),
+        ((13, 15), (13, 15), " +"),
+        ((3, 0), (3, 0), "@"),
+    ],
+)
+def test_incremental_parsing(python_parser_cls, python_parse_str, start, end, text):
+    incremental = IncrementalParser(
+        python_parser_cls, SOURCE, start=lambda parser: parser.parse("file")
+    )
+    incremental.parse()
+    old_text = SOURCE[incremental.offset(start) : incremental.offset(end)]
+    tree = parse_or_error(lambda: incremental.edit(start, end, text))
+    assert tree == parse_or_error(lambda: python_parse_str(incremental.source, "exec"))
+    # Undo the edit.
+    lines = text.split("\n")
+    column = len(lines[-1]) + (start[1] if len(lines) == 1 else 0)
+    tree = parse_or_error(
+        lambda: incremental.edit(start, (start[0] + len(lines) - 1, column), old_text)
+    )
+    assert incremental.source == SOURCE
+    assert tree == parse_or_error(lambda: python_parse_str(SOURCE, "exec"))
@@ -0,0 +1,62 @@
+"""Test the recognizer generated from the Python grammar with skip_actions."""
+
+import ast
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "filename", sorted(path.name for path in (Path(__file__).parent / "data").glob("*.py"))
+)
+def test_recognizer(python_recognizer_module, filename):
+    path = Path(__file__).parent / "data" / filename
+    for part in path.read_text().split("\n\n\n"):
+        try:
+            ast.parse(part)
+        except SyntaxError:
+            # The syntax is too recent for this version of Python.
+            continue
+        assert python_recognizer_module.parse_string(part, "exec") is True
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "f(**a, *b)\n",
+        "a = = 1\n",
+        "def f(:\n    pass\n",
+        "if x:\npass\n",
+        "print 'hello'\n",
+        "(a, b) += 1, 2\n",
+    ],
+)
+def test_recognizer_syntax_error(python_recognizer_module, python_parse_str, source):
+    with pytest.raises(SyntaxError):
+        python_parse_str(source, "exec")
+    with pytest.raises(SyntaxError) as info:
+        python_recognizer_module.parse_string(source, "exec")
+    # The recognizer does not call the invalid rules building the messages.
+    assert info.value.msg == "invalid syntax"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "f(*)\n",
+        "match x:\n case 1 + 2: pass\n",
+        "match x:\n case 1j + 2j: pass\n",
+        "def f[*T: int](): pass\n",
+        "f'{a!z}'\n",
+    ],
+)
+def test_recognizer_checks(python_recognizer_module, python_parse_str, source):
+    with pytest.raises(SyntaxError):
+        python_parse_str(source, "exec")
+    # The actions raising syntax errors or checking their items are kept.
+    with pytest.raises(SyntaxError):
+        python_recognizer_module.parse_string(source, "exec")
+
+
+def test_recognizer_eval(python_recognizer_module):
+    assert python_recognizer_module.parse_string("1 + f(x)[0]", "eval") is True
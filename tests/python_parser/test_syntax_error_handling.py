@@ -1605,3 +1605,30 @@ def test_syntax_error_in_type_params(
     parse_invalid_syntax(
         python_parse_file, python_parse_str, tmp_path, source, exception, message, start, end
     )
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "f(a for a in b, c)\n",
+        "if x:\npass\n",
+        "class A:\n    def f(self):\n        x = 1 +\n",
+        "1 +* 2\n",
+        "def f(:\n    pass\n",
+        "for x in range(10):\n    pass\nelse:\n  yield = 1\n",
+        "try:\n    pass\nexcept E:\n    pass\nfinally:\n    f(a for a in b, c)\n",
+        "if x:\n    pass\nelif y:\n    pass\nelse:\n    del f()\n",
+        "  x = 1\n",
+    ],
+)
+def test_localized_error_pass(python_parse_str, source):
+    prefix = (
+        "import os\n\ndef g(a, b=1):\n    return a + b\n\nclass C:\n    x = [i for i in y]\n\n"
+    )
+    errors = []
+    for localized in (False, True):
+        with pytest.raises(SyntaxError) as e:
+            python_parse_str(prefix + source, "exec", localized_error_pass=localized)
+        exc = e.value
+        errors.append((type(exc), exc.msg, exc.lineno, exc.offset, exc.end_lineno, exc.end_offset))
+    assert errors[0] == errors[1]
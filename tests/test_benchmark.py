@@ -0,0 +1,63 @@
+from pathlib import Path
+from typing import Any, Dict, List
+
+from pegen.benchmark import compare_results, format_results, run_benchmarks, t_critical
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def results(times: Dict[str, List[float]]) -> Dict[str, Any]:
+    return {"benchmarks": {name: {"times": values} for name, values in times.items()}}
+
+
+def test_t_critical() -> None:
+    assert t_critical(0.5) == 12.706
+    assert t_critical(4) == 2.776
+    # Degrees of freedom between two tabulated ones use the smaller ones.
+    assert t_critical(13.7) == 2.179
+    assert t_critical(10**6) == 1.962
+
+
+def test_compare_results() -> None:
+    baseline = results(
+        {
+            "slower": [1.0, 1.01, 0.99, 1.0],
+            "faster": [1.0, 1.01, 0.99, 1.0],
+            "noisy": [1.0, 2.0, 0.5, 1.5],
+            "small": [1.0, 1.001, 0.999, 1.0],
+            "removed": [1.0, 1.0],
+        }
+    )
+    current = results(
+        {
+            "slower": [1.2, 1.21, 1.19, 1.2],
+            "faster": [0.8, 0.81, 0.79, 0.8],
+            "noisy": [1.5, 2.5, 1.0, 1.0],
+            "small": [1.01, 1.011, 1.009, 1.01],
+            "added": [1.0, 1.0],
+        }
+    )
+    comparisons = {c.name: c for c in compare_results(baseline, current)}
+    assert set(comparisons) == {"slower", "faster", "noisy", "small"}
+    assert comparisons["slower"].regression
+    assert round(comparisons["slower"].change, 3) == 0.2
+    assert comparisons["faster"].significant and not comparisons["faster"].regression
+    # The difference is not significant compared to the noise.
+    assert not comparisons["noisy"].significant
+    # The difference is significant but smaller than the minimal change.
+    assert not comparisons["small"].significant
+    assert compare_results(baseline, current, min_change=0.005)[3].regression
+
+
+def test_run_benchmarks(tmp_path: Path) -> None:
+    source = tmp_path / "input.txt"
+    source.write_text("1 + 2\n(3 - 4) * 5\n")
+    data = run_benchmarks([str(DATA_DIR / "expr.gram")], [str(source)], runs=2, warmup=0)
+    assert data["runs"] == 2
+    assert set(data["benchmarks"]) == {"expr.gram:generate", "expr.gram:input.txt"}
+    bench = data["benchmarks"]["expr.gram:input.txt"]
+    assert len(bench["times"]) == 2
+    assert bench["lines"] == 2
+    # NUMBER '+' NUMBER NEWLINE ENDMARKER and 9 tokens for the second line.
+    assert bench["tokens"] == 5 + 9
+    assert len(format_results(data)) == 3
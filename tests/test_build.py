@@ -0,0 +1,97 @@
+import io
+import os
+import tokenize
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pegen.build import build_cached_python_parser, cache_key, cached_python_parser
+from pegen.grammar import GrammarError
+from pegen.memo_profile import MemoProfile
+from pegen.tokenizer import Tokenizer
+from pegen.utils import make_parser
+
+GRAMMAR = """
+start: expr NEWLINE
+expr: term '+' expr | term
+term: NUMBER
+"""
+
+
+def test_cache_key() -> None:
+    key = cache_key(GRAMMAR)
+    assert key == cache_key(GRAMMAR)
+    assert key != cache_key(GRAMMAR + "\n")
+    assert key != cache_key(GRAMMAR, "expr.gram")
+    assert key != cache_key(GRAMMAR, inline_memo=True)
+    assert cache_key(GRAMMAR, tokens={"NAME", "OP"}) == cache_key(GRAMMAR, tokens={"OP", "NAME"})
+    profile = MemoProfile()
+    profile.count("expr", "hits")
+    other = MemoProfile()
+    other.count("term", "hits")
+    assert cache_key(GRAMMAR, memo_profile=profile) != cache_key(GRAMMAR, memo_profile=other)
+
+
+def test_cached_python_parser(tmp_path: Path) -> None:
+    path = cached_python_parser(GRAMMAR, cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    os.utime(path, (0, 0))
+    # The parser is not generated again for the same grammar and options.
+    assert cached_python_parser(GRAMMAR, cache_dir=str(tmp_path)) == path
+    assert os.path.getmtime(path) == 0
+    other = cached_python_parser(GRAMMAR, cache_dir=str(tmp_path), specialize_literals=True)
+    assert other != path
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_cached_python_parser_syntax_error(tmp_path: Path) -> None:
+    with pytest.raises(SyntaxError):
+        cached_python_parser("start: :\n", cache_dir=str(tmp_path / "cache"))
+    assert not (tmp_path / "cache").exists()
+
+
+def test_cached_python_parser_generation_error(tmp_path: Path) -> None:
+    with pytest.raises(GrammarError):
+        cached_python_parser("start: undefined\n", cache_dir=str(tmp_path))
+    # The temporary file is removed.
+    assert os.listdir(tmp_path) == []
+
+
+def test_build_cached_python_parser(tmp_path: Path) -> None:
+    grammar_file = tmp_path / "expr.gram"
+    grammar_file.write_text(GRAMMAR)
+    output = str(tmp_path / "parser.py")
+    cache_dir = str(tmp_path / "cache")
+    assert build_cached_python_parser(str(grammar_file), output, cache_dir) == output
+    assert "expr.gram" in Path(output).read_text()
+    os.utime(output, (0, 0))
+    build_cached_python_parser(str(grammar_file), output, cache_dir)
+    # The output is not written again when it did not change.
+    assert os.path.getmtime(output) == 0
+    assert build_cached_python_parser(str(grammar_file), None, cache_dir) != output
+
+
+def test_make_parser_cache_dir(tmp_path: Path) -> None:
+    parser_class = make_parser(GRAMMAR, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob("parser_*.py"))) == 1
+    assert make_parser(GRAMMAR, cache_dir=str(tmp_path)) is not parser_class
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO("1 + 2\n").readline))
+    assert parser_class(tokenizer).start()
+
+
+def test_make_parser_cache_dir_class(tmp_path: Path) -> None:
+    parser_class = make_parser("@class ExprParser\n" + GRAMMAR, cache_dir=str(tmp_path))
+    assert parser_class.__name__ == "ExprParser"
+
+
+def test_make_parser_cache_dir_hit(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    make_parser(GRAMMAR, cache_dir=str(tmp_path))
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("the grammar was parsed")
+
+    monkeypatch.setattr("pegen.build.GrammarParser", fail)
+    monkeypatch.setattr("pegen.utils.GrammarParser", fail)
+    parser_class = make_parser(GRAMMAR, cache_dir=str(tmp_path))
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO("1 + 2\n").readline))
+    assert parser_class(tokenizer).start()
@@ -0,0 +1,83 @@
+import textwrap
+
+import pytest
+from pegen.incremental import IncrementalParser
+from pegen.utils import make_parser, parse_string
+
+GRAMMAR = """
+start: stmt+ ENDMARKER
+stmt: NAME '=' expr NEWLINE
+expr: expr '+' term | term
+term: NUMBER | NAME | '(' expr ')'
+"""
+
+SOURCE = textwrap.dedent(
+    """\
+    a = 1 + 2
+    b = (a + 3) + 4
+    c = b + a
+    """
+)
+
+
+@pytest.mark.parametrize(
+    "start, end, text",
+    [
+        ((2, 5), (2, 6), "x"),  # same number of tokens
+        ((2, 5), (2, 10), "7"),  # fewer tokens
+        ((2, 4), (2, 4), "8 + "),  # more tokens
+        ((2, 0), (2, 0), "z = 5\n"),  # new line
+        ((1, 9), (2, 15), ""),  # removed line
+    ],
+)
+def test_edit(start, end, text) -> None:
+    parser_class = make_parser(GRAMMAR)
+    incremental = IncrementalParser(parser_class, SOURCE)
+    assert incremental.parse() == parse_string(SOURCE, parser_class)
+    tree = incremental.edit(start, end, text)
+    assert tree == parse_string(incremental.source, parser_class)
+    assert incremental.reused_entries > 0
+
+
+def test_edit_reuses_entries_after_the_edit() -> None:
+    parser_class = make_parser(GRAMMAR)
+    incremental = IncrementalParser(parser_class, SOURCE)
+    incremental.parse()
+    last_stmt, _ = incremental._cache[len(incremental.tokens) - 7, "stmt", ()]  # type: ignore
+    # The token count changes but not the line count: the entries of the last
+    # line are shifted rather than computed again.
+    incremental.edit((2, 4), (2, 4), "8 + ")
+    assert incremental.source == SOURCE.replace("b = (", "b = 8 + (")
+    tree, _ = incremental._cache[len(incremental.tokens) - 7, "stmt", ()]  # type: ignore
+    assert tree is last_stmt
+
+
+def test_edit_syntax_error() -> None:
+    parser_class = make_parser(GRAMMAR)
+    incremental = IncrementalParser(parser_class, SOURCE)
+    incremental.parse()
+    assert incremental.edit((2, 11), (2, 11), "+") is None
+    assert incremental.reused_entries == 0
+    tree = incremental.edit((2, 11), (2, 12), "")
+    assert tree == parse_string(SOURCE, parser_class)
+    # Unbalanced parentheses break the tokenizer, which is not retried.
+    assert incremental.edit((2, 10), (2, 11), "") is None
+    assert incremental.tokens == []
+    assert incremental.edit((2, 10), (2, 10), ")") == parse_string(SOURCE, parser_class)
+
+
+def test_invalid_edit() -> None:
+    incremental = IncrementalParser(make_parser(GRAMMAR), SOURCE)
+    with pytest.raises(ValueError, match="Line 5"):
+        incremental.edit((5, 0), (5, 0), "")
+    with pytest.raises(ValueError, match="Column 10"):
+        incremental.edit((1, 10), (1, 10), "")
+    with pytest.raises(ValueError, match="before its start"):
+        incremental.edit((2, 1), (1, 1), "")
+
+
+def test_packed_memo_not_supported() -> None:
+    parser_class = make_parser(GRAMMAR)
+    parser_class.packed_memo = True
+    with pytest.raises(ValueError):
+        IncrementalParser(parser_class, SOURCE)
@@ -0,0 +1,65 @@
+import io
+import tokenize
+
+import pytest
+from pegen.grammar import Grammar
+from pegen.grammar_parser import GeneratedParser as GrammarParser
+from pegen.memo_profile import MemoProfile
+from pegen.python_generator import PythonParserGenerator
+from pegen.tokenizer import Tokenizer
+from pegen.utils import generate_parser, parse_string
+
+GRAMMAR = """
+start: a NEWLINE
+a: b '+' c | b
+b: NUMBER
+c: NUMBER
+"""
+
+
+def profile_parse(source: str, packed: bool = False) -> MemoProfile:
+    grammar: Grammar = parse_string(GRAMMAR, GrammarParser)
+    parser_class = generate_parser(grammar)
+    parser_class.packed_memo = packed
+    profile = MemoProfile()
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+    parser = parser_class(tokenizer)
+    profile.instrument(parser)
+    assert parser.start()
+    return profile
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_instrument(packed: bool) -> None:
+    profile = profile_parse("1\n", packed)
+    # The second alternative of a reuses the result of b.
+    assert profile.rules["b"] == {"hits": 1, "misses": 1, "stores": 1}
+    assert profile.rules["a"] == {"hits": 0, "misses": 1, "stores": 1}
+    assert profile.hit_rate("b") == 0.5
+    assert profile.hit_rate("a") == 0
+    assert profile.hit_rate("c") is None
+
+
+def test_dump_load_merge() -> None:
+    profile = profile_parse("1\n")
+    out = io.StringIO()
+    profile.dump(out)
+    loaded = MemoProfile.load(io.StringIO(out.getvalue()))
+    assert loaded.rules == profile.rules
+    loaded.merge(profile)
+    assert loaded.rules["b"] == {"hits": 2, "misses": 2, "stores": 2}
+
+
+def test_profile_guided_generation() -> None:
+    profile = profile_parse("1\n")
+    grammar: Grammar = parse_string(GRAMMAR, GrammarParser)
+    out = io.StringIO()
+    genr = PythonParserGenerator(grammar, out, memo_mode="profile", memo_profile=profile)
+    genr.generate("<string>")
+    source = out.getvalue()
+    assert "    @memoize\n    def b(self)" in source
+    assert "    @logger\n    def a(self)" in source
+    assert "    @logger\n    def c(self)" in source
+
+    with pytest.raises(ValueError):
+        PythonParserGenerator(grammar, io.StringIO(), memo_mode="profile")
@@ -2,15 +2,24 @@ import ast
 import difflib
 import io
 import textwrap
+import tokenize
 from tokenize import NAME, NEWLINE, NUMBER, OP, TokenInfo
 from typing import Any, Dict, Type
 
 import pytest
 from pegen.grammar import Grammar, GrammarError
 from pegen.grammar_parser import GeneratedParser as GrammarParser
-from pegen.parser import Parser
+from pegen.parser import PackedMemoTable, Parser
 from pegen.python_generator import PythonParserGenerator
-from pegen.utils import generate_parser, make_parser, parse_string
+from pegen.tokenizer import Tokenizer
+from pegen.utils import ParserClassCache, generate_parser, make_parser, parse_string, parser_cache
+
+
+def generate_source(grammar: Grammar, **options: Any) -> str:
+    out = io.StringIO()
+    genr = PythonParserGenerator(grammar, out, **options)
+    genr.generate("<string>")
+    return out.getvalue()
 
 
 def test_parse_grammar() -> None:
@@ -362,6 +371,115 @@ def test_python_expr() -> None:
     assert val == 3.0
 
 
+def test_lazy_locations() -> None:
+    grammar_source = """
+    start: a=atom? b=NAME NEWLINE { ast.Tuple([a, b], ast.Load(), LOCATIONS) }
+    atom: n=NUMBER { ast.Constant(int(n.string), LOCATIONS) }
+    """
+    source = generate_source(parse_string(grammar_source, GrammarParser))
+    # The rules look their locations up only when an alternative builds a node.
+    assert "self._tokenizer.peek()" not in source
+    assert source.count("self._tokenizer.get_start(mark)") == 2
+    parser_class = make_parser(grammar_source)
+    node = parse_string("x\n", parser_class)
+    assert (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset) == (1, 0, 1, 1)
+    node = parse_string("12  x\n", parser_class)
+    assert (node.col_offset, node.end_col_offset) == (0, 5)
+    assert (node.elts[0].col_offset, node.elts[0].end_col_offset) == (0, 2)
+
+
+def test_local_aliases() -> None:
+    grammar_source = """
+    start: a=stmt* ENDMARKER { a }
+    stmt: NAME '=' NUMBER NEWLINE { self._mark() } | '(' NAME ')' NEWLINE | &'pass' 'pass' NEWLINE
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, local_aliases=True)
+    assert "\0" not in source
+    assert "        _reset = self._reset\n        _expect = self.expect\n" in source
+    assert "(_expect('NEWLINE'))" in source
+    # Methods called once by a rule and the actions are left alone.
+    assert "_positive_lookahead" not in source
+    assert "return self . _mark ( );" in source
+
+    parser_class = generate_parser(grammar, local_aliases=True)
+    reference_class = generate_parser(grammar)
+    text = "x = 1\n(y)\npass\n"
+    assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    with pytest.raises(SyntaxError):
+        parse_string("x = y\n", parser_class)
+
+
+def test_inline_lookaheads() -> None:
+    grammar_source = """
+    start: stmt* ENDMARKER
+    stmt: &('def' | NAME) NAME !'=' NEWLINE | &expr expr ';' NEWLINE | NAME &&'=' expr NEWLINE
+    expr: NUMBER | &"match" NAME
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, inline_lookaheads=True)
+    assert (
+        "((_next_tok := self._tokenizer.peek()).string == 'def' or "
+        "(_next_tok.type == tokenize.NAME and _next_tok.string not in self._keywords))"
+        in source
+    )
+    assert (
+        "(not ((_next_tok := self._tokenizer.peek()).string == '=' "
+        "or _next_tok.type == tokenize.EQUAL))" in source
+    )
+    assert '(self._tokenizer.peek().string == "match")' in source
+    # Lookaheads on rules are still called.
+    assert "(self.positive_lookahead(self.expr, ))" in source
+    assert "_tmp_" not in source
+
+    parser_class = generate_parser(grammar, inline_lookaheads=True)
+    reference_class = generate_parser(grammar)
+    text = "x\nx = 1\nmatch ;\n"
+    assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    for text in ("x = \n", "1\n"):
+        with pytest.raises(SyntaxError):
+            parse_string(text, parser_class)
+
+
+@pytest.mark.parametrize("local_aliases", [False, True])
+def test_inline_lookaheads_custom_header(local_aliases: bool) -> None:
+    grammar_source = """
+    @header 'from typing import Any, Optional\\nfrom pegen.parser import memoize, Parser'
+    start: NAME !'=' NEWLINE
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    # The inlined lookaheads refer to the token types of the tokenize module.
+    assert "import tokenize\n" in generate_source(grammar, inline_lookaheads=True)
+    parser_class = generate_parser(grammar, inline_lookaheads=True, local_aliases=local_aliases)
+    assert parse_string("x\n", parser_class)
+    with pytest.raises(SyntaxError):
+        parse_string("x = 1\n", parser_class)
+
+
+def test_loop_left_recursion() -> None:
+    grammar_source = """
+    start: e=expr NEWLINE { e }
+    expr: a=expr '+' b=term { ('+', a, b) } | a=expr '-' ~ b=term { ('-', a, b) } | term
+    term: NUMBER | '(' expr ')'
+    other: NUMBER | other '+' NUMBER
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, loop_left_recursion=True)
+    assert "    @memoize_left_rec(tail='_expr_tail')\n    def expr(self)" in source
+    assert "    @logger\n    def _expr_tail(self)" in source
+    assert "        # _expr_tail: expr '+' term | expr '-' ~ term\n" in source
+    # Rules with left-recursive alternatives after other ones are left alone.
+    assert "    @memoize_left_rec\n    def other(self)" in source
+
+    parser_class = generate_parser(grammar, loop_left_recursion=True)
+    reference_class = generate_parser(grammar)
+    for text in ("1\n", "1 + 2 - (3 - 4) + 5\n"):
+        assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    for text in ("1 - 2 +\n", "1 - +\n"):
+        with pytest.raises(SyntaxError):
+            parse_string(text, parser_class)
+
+
 def test_nullable() -> None:
     grammar_source = """
     start: sign NUMBER
@@ -694,3 +812,331 @@ def test_keywords() -> None:
     parser_class = make_parser(grammar)
     assert parser_class.KEYWORDS == ("five", "four", "one", "three", "two")
     assert parser_class.SOFT_KEYWORDS == ("eight", "nine", "seven", "six", "ten")
+
+
+def test_packed_memo() -> None:
+    grammar = """
+    start: expr NEWLINE
+    expr: ('-' term | expr '+' term | term)
+    term: NUMBER
+    """
+    parser_class = make_parser(grammar)
+
+    class PackedParser(parser_class):  # type: ignore
+        packed_memo = True
+
+    source = "1 + 2 + 3\n"
+    assert parse_string(source, PackedParser) == parse_string(source, parser_class)
+
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO(source).readline))
+    parser = PackedParser(tokenizer)
+    parser.start()
+    assert isinstance(parser._cache, PackedMemoTable)
+    assert (0, "expr", ()) in parser._cache
+    assert parser._cache[0, "term", ()][1] == 1
+    assert len(parser._cache) == len(list(parser._cache))
+    parser._cache.clear()
+    assert len(parser._cache) == 0
+
+
+def test_inline_memo() -> None:
+    grammar_source = """
+    start: expr NEWLINE
+    expr: ('-' term | expr '+' term | term)
+    term: NUMBER | '(' expr ')'
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    out = io.StringIO()
+    genr = PythonParserGenerator(grammar, out, inline_memo=True)
+    genr.generate("<string>")
+    source = out.getvalue()
+    assert "@memoize\n" not in source
+    assert "@memoize_left_rec" in source
+    assert "_key = self._slot_term\n" in source
+    assert "INLINE_MEMO_RULES = ('start', 'term')" in source
+
+    parser_class = generate_parser(grammar, inline_memo=True)
+    reference_class = generate_parser(grammar)
+    for text in ("1 + (2 + 3)\n", "(1 + 2) + 3\n"):
+        assert parse_string(text, parser_class) == parse_string(text, reference_class)
+
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO("1 + 2\n").readline))
+    parser = parser_class(tokenizer)
+    parser.start()
+    assert parser._cache[0, "term", ()][1] == 1
+    assert parser._cache[0, "start", ()][1] == 4
+
+    class PackedParser(parser_class):  # type: ignore
+        packed_memo = True
+
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO("1 + 2\n").readline))
+    parser = PackedParser(tokenizer)
+    assert parser.start() == parse_string("1 + 2\n", reference_class)
+    # The inlined lookups use the rows of the packed table.
+    assert parser._cache.row(0)[PackedMemoTable.slot("term")][1] == 1
+    assert parser._cache[0, "start", ()][1] == 4
+
+
+def test_memo_mode_flagged() -> None:
+    grammar_source = """
+    start: a NEWLINE
+    a (memo): b '+' c | b
+    b: NUMBER
+    c: NUMBER
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    assert grammar.rules["a"].memo
+    assert not grammar.rules["b"].memo
+    source = generate_source(grammar, memo_mode="flagged")
+    assert "    @memoize\n    def a(self)" in source
+    assert "    @logger\n    def b(self)" in source
+    source = generate_source(grammar, memo_mode="flagged", inline_memo=True)
+    assert "    def b(self)" in source
+    assert "@logger" not in source
+
+    parser_class = generate_parser(grammar, memo_mode="flagged")
+    assert parse_string("1 + 2\n", parser_class) == parse_string(
+        "1 + 2\n", generate_parser(grammar)
+    )
+
+
+def test_memo_mode_auto() -> None:
+    grammar_source = """
+    start: a NEWLINE
+    a: b '+' c | b
+    b: NUMBER
+    c: NUMBER
+    d: d '*' e | e
+    e: NUMBER
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, memo_mode="auto")
+    # b is called at the same position by both alternatives of a.
+    assert "    @memoize\n    def b(self)" in source
+    assert "    @logger\n    def c(self)" in source
+    assert "    @logger\n    def a(self)" in source
+    # e is re-evaluated at the same position while growing the left-recursive d.
+    assert "    @memoize\n    def e(self)" in source
+    assert "    @memoize_left_rec\n    def d(self)" in source
+
+    parser_class = generate_parser(grammar, memo_mode="auto")
+    assert parse_string("1 + 2\n", parser_class) == parse_string(
+        "1 + 2\n", generate_parser(grammar)
+    )
+
+
+def test_memo_mode_invalid() -> None:
+    grammar: Grammar = parse_string("start: NAME\n", GrammarParser)
+    with pytest.raises(ValueError):
+        PythonParserGenerator(grammar, io.StringIO(), memo_mode="sometimes")
+
+
+def test_specialize_literals() -> None:
+    grammar_source = """
+    start: stmt* ENDMARKER
+    stmt: 'if' NAME &&':' NEWLINE | "match" NAME &'(' '(' ')' NEWLINE | NAME NEWLINE
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, specialize_literals=True)
+    assert "self.expect(" not in source
+    assert "self.expect_string('if')" in source
+    assert 'self.expect_string("match")' in source
+    assert "self.positive_lookahead(self.expect_operator, '(', tokenize.LPAR)" in source
+    assert "self.expect_forced(self.expect_operator(':', tokenize.COLON), \"':'\")" in source
+    assert "self.expect_type(tokenize.NEWLINE)" in source
+
+    parser_class = generate_parser(grammar, specialize_literals=True)
+    reference_class = generate_parser(grammar)
+    text = "if x:\nmatch y()\nz\n"
+    assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    with pytest.raises(SyntaxError, match="expected ':'"):
+        parse_string("if x\n", parser_class)
+
+
+def test_specialize_terminals() -> None:
+    grammar_source = """
+    start: item* ENDMARKER
+    item: a=NAME b=NUMBER NEWLINE { (a.string, b.string) } | SOFT_KEYWORD STRING NEWLINE { "soft" }
+    other: 'kw' NAME
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, specialize_terminals=True)
+    assert "self.name()" not in source
+    assert "(a := self.expect_name())" in source
+    assert "(b := self.expect_type(tokenize.NUMBER))" in source
+    assert "self.expect_soft_keyword()" in source
+    assert "self.expect_type(tokenize.STRING)" in source
+
+    parser_class = generate_parser(grammar, specialize_terminals=True)
+    assert parser_class._keywords == frozenset({"kw"})
+    text = "x 1\ny 2\n"
+    assert parse_string(text, parser_class) == parse_string(text, generate_parser(grammar))
+    assert parse_string(text, parser_class)[0] == [("x", "1"), ("y", "2")]
+    with pytest.raises(SyntaxError):
+        parse_string("kw 1\n", parser_class)
+
+
+def test_first_set_guards() -> None:
+    grammar_source = """
+    start: stmt* ENDMARKER | &&';'
+    stmt: 'if' ~ NAME ':' NEWLINE | assign | call
+    assign: NAME '=' (NUMBER | NAME) NEWLINE
+    call: !'if' primary '(' ')' NEWLINE
+    primary: primary '.' NAME | NAME
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, first_set_guards=True)
+    assert source.count("_tok = self._tokenizer.peek()") == 6
+    # The cut is only reached after matching 'if'.
+    assert "(_tok.string == 'if')\n" in source
+    # Guards go through lookaheads and left-recursive rules.
+    guard = "(_tok.type == tokenize.NAME)\n            and\n            "
+    assert guard + "(self.negative_lookahead" in source
+    assert guard + "(primary :=" in source
+    # Alternatives starting with a forced item are always tried.
+    assert "if (\n            (forced := self.expect_forced(" in source
+
+    parser_class = generate_parser(grammar, first_set_guards=True)
+    reference_class = generate_parser(grammar)
+    text = "if x:\nx = 1\nx.y()\n"
+    assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    with pytest.raises(SyntaxError, match="expected ';'"):
+        parse_string("1\n", parser_class)
+
+
+def test_dispatch_tables() -> None:
+    grammar_source = """
+    start: stmt* ENDMARKER
+    stmt: &('def' | '@') 'def' NAME NEWLINE | 'pass' NEWLINE | '@' NAME NEWLINE | e=expr NEWLINE { e } | 'if' NAME NEWLINE
+    expr: NUMBER | NAME
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, dispatch_tables=True)
+    assert (
+        "_stmt_dispatch = {'@': 4, 'def': 1, 'if': 16, 'pass': 2, "
+        "tokenize.AT: 4, tokenize.NAME: 8, tokenize.NUMBER: 8}" in source
+    )
+    assert "if not _alts:\n            return None;" in source
+    assert "(_alts & 8)\n            and\n            (e := self.expr())" in source
+    # Rules with few alternatives are not guarded without first_set_guards.
+    assert "_expr_dispatch" not in source
+    assert "_tok.type == tokenize.NUMBER" not in source
+
+    parser_class = generate_parser(grammar, dispatch_tables=True)
+    reference_class = generate_parser(grammar)
+    text = "def f\npass\n@ d\nif x\n1\npass\n"
+    assert parse_string(text, parser_class) == parse_string(text, reference_class)
+    with pytest.raises(SyntaxError):
+        parse_string("= x\n", parser_class)
+
+
+def test_invalid_sensitive_rules() -> None:
+    grammar_source = """
+    start: stmt* ENDMARKER
+    stmt: assign | expr NEWLINE
+    assign: NAME '=' expr NEWLINE | invalid_assign
+    invalid_assign: NUMBER '=' { RAISE_SYNTAX_ERROR("cannot assign") }
+    expr: (NAME | NUMBER)+
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    parser_class = generate_parser(grammar)
+    assert parser_class.INVALID_SENSITIVE_RULES == {
+        "start",
+        "stmt",
+        "assign",
+        "invalid_assign",
+        "_loop0_1",
+    }
+    assert "INVALID_SENSITIVE_RULES" not in generate_source(
+        parse_string("start: NAME NEWLINE\n", GrammarParser)
+    )
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_forget_rules(packed: bool) -> None:
+    grammar_source = """
+    start: expr NEWLINE
+    expr: term '+' term | term
+    term: NUMBER
+    """
+    parser_class = make_parser(grammar_source)
+    tokenizer = Tokenizer(tokenize.generate_tokens(io.StringIO("1 + 2\n").readline))
+    parser = type("Parser", (parser_class,), {"packed_memo": packed})(tokenizer)
+    parser.start()
+    parser.forget_rules({"expr", "start"})
+    assert {key[1] for key in parser._cache} == {"term", "number", "expect"}
+    assert (0, "term", ()) in parser._cache
+    parser.forget_rules(None)
+    assert len(parser._cache) == 0
+
+
+def test_make_parser_cache() -> None:
+    grammar_source = """
+    start: NAME NEWLINE
+    """
+    parser_cache.clear()
+    parser_class = make_parser(grammar_source, use_cache=True)
+    assert (parser_cache.hits, parser_cache.misses) == (0, 1)
+    assert make_parser(textwrap.dedent(grammar_source), use_cache=True) is parser_class
+    assert (parser_cache.hits, parser_cache.misses) == (1, 1)
+    assert make_parser(grammar_source, use_cache=True, inline_memo=True) is not parser_class
+    assert make_parser(grammar_source) is not parser_class
+    assert (parser_cache.hits, parser_cache.misses) == (1, 2)
+    assert len(parser_cache) == 2
+
+
+def test_parser_class_cache_lru() -> None:
+    cache = ParserClassCache(maxsize=2)
+    cache.put("a", Parser)
+    cache.put("b", Parser)
+    assert cache.get("a") is Parser
+    cache.put("c", Parser)
+    # b was the least recently used class.
+    assert cache.get("b") is None
+    assert cache.get("a") is cache.get("c") is Parser
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_skip_actions() -> None:
+    grammar_source = """
+    start: a=stmt* ENDMARKER { a }
+    stmt: a=NAME '=' b=NUMBER NEWLINE { ast.Assign(a, b, LOCATIONS) } | invalid_stmt | empty
+    empty: ';' NEWLINE { None }
+    invalid_stmt: a=NUMBER '=' { RAISE_SYNTAX_ERROR_KNOWN_LOCATION(a, "cannot assign") }
+    """
+    grammar: Grammar = parse_string(grammar_source, GrammarParser)
+    source = generate_source(grammar, skip_actions=True)
+    assert "ast.Assign" not in source
+    assert "start_lineno" not in source
+    assert "self.invalid_stmt" not in source
+    assert "def invalid_stmt" not in source
+    assert "INVALID_SENSITIVE_RULES = frozenset([])" in source
+    parser_class = make_parser(grammar_source, skip_actions=True)
+    assert parse_string("x = 1\ny = 2\n", parser_class) is True
+    # The action of empty returns None, so the rule keeps failing.
+    with pytest.raises(SyntaxError):
+        parse_string("x = 1\n;\n", parser_class)
+    with pytest.raises(SyntaxError):
+        parse_string("1 = x\n", parser_class)
+
+
+def test_skip_actions_checks() -> None:
+    recognizer_action = PythonParserGenerator.recognizer_action
+    assert recognizer_action("ast.Name(id=a.string, LOCATIONS)") == "True"
+    assert (
+        recognizer_action(
+            'self.check_version((3, 8), "Walrus is", ast.NamedExpr(a, b, LOCATIONS))'
+        )
+        == 'self.check_version((3, 8), "Walrus is", True) is not None'
+    )
+    assert (
+        recognizer_action("ast.Constant(value=self.ensure_real(real), LOCATIONS)")
+        == "self.ensure_real(real) is not None"
+    )
+    assert (
+        recognizer_action('a if b else self.raise_syntax_error("invalid")')
+        == '(True if b else self.raise_syntax_error("invalid")) is not None'
+    )
@@ -1,8 +1,10 @@
 import io
 import sys
-from tokenize import NEWLINE, NUMBER, ENDMARKER, TokenInfo, generate_tokens
+from tokenize import DEDENT, ENDMARKER, INDENT, NEWLINE, NUMBER, TokenInfo, generate_tokens
 
-from pegen.tokenizer import Tokenizer
+import pytest
+
+from pegen.tokenizer import CompactTokenBuffer, Tokenizer, generate_tokens_from, retokenize
 
 
 def test_peek_getnext():
@@ -18,9 +20,10 @@ def test_peek_getnext():
     )
 
 
-def test_mark_reset():
+@pytest.mark.parametrize("compact", [False, True])
+def test_mark_reset(compact):
     source = io.StringIO("\n1 2")
-    t = Tokenizer(generate_tokens(source.readline))
+    t = Tokenizer(generate_tokens(source.readline), compact=compact)
     index = t.mark()
     assert t.peek() == TokenInfo(NUMBER, "1", (2, 0), (2, 1), "1 2")
     assert t.getnext() == TokenInfo(NUMBER, "1", (2, 0), (2, 1), "1 2")
@@ -38,6 +41,18 @@ def test_last_non_whitespace():
     assert t.get_last_non_whitespace_token() == TokenInfo(NUMBER, "1", (2, 0), (2, 1), "1\n")
 
 
+def test_get_start():
+    source = io.StringIO("1 2")
+    t = Tokenizer(generate_tokens(source.readline))
+    # The token at the mark is peeked at if needed.
+    assert t.get_start(0) == (1, 0)
+    t.getnext()
+    t.getnext()
+    assert t.get_start(1) == (1, 2)
+    assert len(t._tokens) == 2
+    assert t.get_start(2) == (1, 3)
+
+
 def test_get_lines():
     source = io.StringIO("1\n2\n3")
     t = Tokenizer(generate_tokens(source.readline))
@@ -45,3 +60,119 @@ def test_get_lines():
         if t.getnext().type == ENDMARKER:
             break
     assert t.get_lines([1, 2, 3]) == ["1\n", "2\n", "3"]
+
+
+def test_last_non_whitespace_after_reset():
+    source = io.StringIO("if x:\n    1\n2")
+    t = Tokenizer(generate_tokens(source.readline))
+    while t.getnext().type != ENDMARKER:
+        pass
+    assert t.get_last_non_whitespace_token().string == "2"
+    t.reset(7)
+    assert [tok.type for tok in t._tokens[4:7]] == [INDENT, NUMBER, NEWLINE]
+    assert t.get_last_non_whitespace_token().string == "1"
+    # Whitespace tokens such as the dedent are skipped.
+    t.reset(8)
+    assert t._tokens[7].type == DEDENT
+    assert t.get_last_non_whitespace_token().string == "1"
+    t.reset(2)
+    assert t.get_last_non_whitespace_token().string == "x"
+
+
+def test_compact_token_buffer():
+    source = 'def f(a):\n    return """a\nb""" + a\n'
+    tokens = list(generate_tokens(io.StringIO(source).readline))
+    buffer = CompactTokenBuffer()
+    for tok in tokens:
+        buffer.append(tok)
+    assert len(buffer) == len(tokens)
+    assert list(buffer) == tokens
+    assert buffer[-1] == tokens[-1]
+    assert buffer[2:5] == tokens[2:5]
+    # Tokens on the same line share the line string.
+    assert buffer[0].line is buffer[1].line
+    with pytest.raises(IndexError):
+        buffer[len(tokens)]
+
+
+def test_compact_tokenizer():
+    source = "if x:\n    1\n2"
+    t = Tokenizer(generate_tokens(io.StringIO(source).readline), compact=True)
+    while t.getnext().type != ENDMARKER:
+        pass
+    assert isinstance(t._tokens, CompactTokenBuffer)
+    assert list(t._tokens) == list(generate_tokens(io.StringIO(source).readline))
+    assert t.get_last_non_whitespace_token().string == "2"
+    t.reset(7)
+    assert t.get_last_non_whitespace_token().string == "1"
+    assert t.get_lines([1, 2, 3]) == ["if x:\n", "    1\n", "2"]
+    # The lines are only kept by the compact buffer.
+    assert not t._lines
+    with pytest.raises(KeyError):
+        t.get_lines([5])
+
+
+def tokenize_source(source):
+    t = Tokenizer(generate_tokens(io.StringIO(source).readline))
+    while t.getnext().type != ENDMARKER:
+        pass
+    return t._tokens
+
+
+def test_generate_tokens_from():
+    source = "class A:\n    def f(self):\n        return 1\n\n    x = 2\n"
+    readline = io.StringIO(source).readline
+    for _ in range(2):
+        readline()
+    tokens = list(generate_tokens_from(readline, 3, ["    ", "        "]))
+    # The INDENT of line 3 belongs to the state given as indents.
+    expected = [t for t in generate_tokens(io.StringIO(source).readline) if t.start[0] >= 3]
+    assert expected[0].type == INDENT
+    assert tokens == expected[1:]
+    assert tokens[0] == TokenInfo(1, "return", (3, 8), (3, 14), "        return 1\n")
+    assert tokens[4].type == DEDENT
+
+
+RETOKENIZE_SOURCE = """\
+class A:
+    def f(self, a):
+        return (a +
+                1)
+
+    x = '''a
+b'''
+    y = 2
+
+def g():
+    pass
+"""
+
+
+@pytest.mark.parametrize(
+    "start, end, text",
+    [
+        ((3, 15), (3, 16), "b"),
+        ((3, 8), (3, 8), "a = 1\n        "),
+        ((3, 0), (5, 0), ""),
+        ((4, 17), (4, 18), ""),
+        ((6, 8), (6, 8), "'"),
+        ((8, 0), (8, 4), ""),
+        ((2, 4), (2, 4), "\\\n"),
+        ((10, 0), (10, 0), "\n\n"),
+        ((11, 4), (11, 8), "return"),
+        ((3, 15), (3, 15), ")"),
+    ],
+)
+def test_retokenize(start, end, text):
+    lines = RETOKENIZE_SOURCE.split("\n")
+    offsets = [sum(len(line) + 1 for line in lines[: pos[0] - 1]) + pos[1] for pos in (start, end)]
+    source = RETOKENIZE_SOURCE[: offsets[0]] + text + RETOKENIZE_SOURCE[offsets[1] :]
+    line_delta = text.count("\n") - (end[0] - start[0])
+    old_tokens = tokenize_source(RETOKENIZE_SOURCE)
+    try:
+        expected = tokenize_source(source)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            retokenize(old_tokens, source, start[0], end[0], line_delta)
+    else:
+        assert retokenize(old_tokens, source, start[0], end[0], line_delta) == expected